@@ -0,0 +1,392 @@
+"""Benchmarks del pipeline de filtrado / deduplicación / render de main.py.
+
+Uso:
+    python benchmark.py                                   # 1k/10k/100k artículos x 50/500 entidades
+    python benchmark.py --articulos 1000,10000 --entidades 50
+    python benchmark.py --corpus corpus/noticias.jsonl.gz  # corpus grabado (NOTICIAS_MODO=record)
+    python benchmark.py --guardar-baseline benchmarks/baseline.json
+    python benchmark.py --comparar benchmarks/baseline.json --tolerancia 0.25
+    python benchmark.py --smtp 500                        # envíos contra un SMTP local
+
+Cada etapa se mide dos veces sobre la misma entrada: una sin trazas para el throughput
+y otra con tracemalloc para el pico de memoria. Con varias escalas se comprueba además que
+las comparaciones por titular de la dedup no crecen con el tamaño del corpus.
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import platform
+import random
+import socketserver
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import main
+
+_MEDIOS = [
+    ("https://www.expansion.com", "Expansión"),
+    ("https://cincodias.elpais.com", "Cinco Días"),
+    ("https://www.eleconomista.es", "elEconomista.es"),
+    ("https://www.lavanguardia.com", "La Vanguardia"),
+    ("https://www.marca.com", "Marca"),
+    ("https://www.reuters.com", "Reuters"),
+    ("https://blog.ejemplo.net", "Blog Ejemplo"),
+]
+
+_RELLENO = (
+    "el la los las de del en con para por sobre tras ante según nuevo nueva gran grupo "
+    "empresa millones euros año mercado clientes resultados trimestre beneficio ventas "
+    "sector banca energía telecomunicaciones España Europa acuerdo proyecto anuncia"
+).split()
+
+
+def _pseudo_palabra(rnd: random.Random) -> str:
+    return "".join(rnd.choice("bcdfghjklmnprstvz") + rnd.choice("aeiou") for _ in range(rnd.randint(2, 4)))
+
+
+def _url_google(url: str) -> str:
+    raw = b"\x08\x13\x22" + bytes([len(url)]) + url.encode("utf-8") + b"\xd2\x01\x00"
+    return "https://news.google.com/rss/articles/" + base64.urlsafe_b64encode(raw).decode().rstrip("=") + "?oc=5"
+
+
+def entidades_sinteticas(n: int, rnd: random.Random) -> List[str]:
+    base = main.CLIENTES + main.COMPETIDORES + main.PARTNERS
+    out = list(base[:n])
+    while len(out) < n:
+        out.append(_pseudo_palabra(rnd).capitalize() + " " + rnd.choice(["Group", "SA", "Tech", "Energía", "Banco"]))
+    return out
+
+
+def articulos_sinteticos(n: int, entidades: List[str], seed: int = 42) -> List[Tuple[str, Dict[str, Any]]]:
+    """Genera (entidad, artículo GNews) con mezcla de medios, keywords, prohibidas y casi-duplicados."""
+    rnd = random.Random(seed)
+    keywords = main.KEYWORDS_GENERALES + main.KEYWORDS_EXACTAS
+    out: List[Tuple[str, Dict[str, Any]]] = []
+    for i in range(n):
+        entidad = rnd.choice(entidades)
+        if out and rnd.random() < 0.15:
+            # Casi-duplicado de un titular anterior
+            _, previo = out[rnd.randrange(len(out))]
+            palabras = previo["title"].split()
+            palabras[rnd.randrange(len(palabras))] = rnd.choice(_RELLENO)
+            titulo = " ".join(palabras)
+        else:
+            palabras = [entidad] + [rnd.choice(_RELLENO) if rnd.random() < 0.35 else _pseudo_palabra(rnd)
+                                    for _ in range(rnd.randint(6, 14))]
+            if rnd.random() < 0.7:
+                palabras.insert(rnd.randrange(1, len(palabras)), rnd.choice(keywords))
+            if rnd.random() < 0.05:
+                palabras.append(rnd.choice(main.PALABRAS_PROHIBIDAS))
+            titulo = " ".join(palabras)
+        home, publisher = rnd.choice(_MEDIOS)
+        url = f"{home}/noticias/{i}-{_pseudo_palabra(rnd)}.html"
+        if rnd.random() < 0.5:
+            url = _url_google(url)
+        out.append((entidad, {
+            "title": titulo,
+            "description": " ".join(rnd.choice(_RELLENO) for _ in range(rnd.randint(10, 30))),
+            "url": url,
+            "published date": "Mon, 13 Oct 2025 07:00:00 GMT",
+            "publisher": {"href": home, "title": publisher},
+        }))
+    return out
+
+
+def articulos_de_corpus(path: str, n: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Artículos de un corpus grabado, repetidos en bucle hasta llegar a `n`."""
+    base: List[Tuple[str, Dict[str, Any]]] = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for linea in f:
+            reg = json.loads(linea)
+            if reg.get("tipo") == "gnews":
+                base.extend((reg["consulta"], a) for a in reg["resultados"])
+    if not base:
+        raise SystemExit(f"El corpus {path} no contiene respuestas de GNews.")
+    return [base[i % len(base)] for i in range(n)]
+
+
+def medir(nombre: str, n: int, fn: Callable[[], Any], memoria: bool) -> Dict[str, Any]:
+    inicio = time.perf_counter()
+    fn()
+    segundos = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        tracemalloc.start()
+        fn()
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    res = {
+        "etapa": nombre,
+        "n": n,
+        "segundos": round(segundos, 6),
+        "por_segundo": round(n / segundos, 1) if segundos else None,
+        "pico_bytes": pico,
+    }
+    pico_txt = f"{pico / 1e6:8.2f} MB" if pico is not None else "       -"
+    print(f"  {nombre:<28} n={n:<7} {segundos:9.4f}s {res['por_segundo'] or 0:>12.1f}/s  pico {pico_txt}")
+    return res
+
+
+def ejecutar_escala(articulos: List[Tuple[str, Dict[str, Any]]], entidades: List[str], memoria: bool) -> List[Dict[str, Any]]:
+    n = len(articulos)
+    textos = [((a.get("title") or "") + " " + (a.get("description") or "")).lower() for _, a in articulos]
+    titulos = [(a.get("title") or "") for _, a in articulos]
+    resultados = []
+
+    def etapa_allowed_source():
+        main._resolve_memo.cache_clear()
+        for _, a in articulos:
+            main.allowed_source(a)
+
+    def etapa_prohibidas():
+        for t in textos:
+            main.contiene_palabra_prohibida(t)
+
+    def etapa_keywords():
+        for t in textos:
+            main._KEYWORD_MATCHER.analizar(t)
+
+    def etapa_entidades():
+        matcher = main.EntityMatcher(entidades)
+        for t in textos:
+            matcher.entidades_en(t)
+
+    comparaciones = [0]
+
+    def etapa_dedup():
+        # Como en el pipeline: la firma se calcula una vez y sirve para buscar y para indexar
+        detector = main.DetectorDuplicados()
+        for t in titulos:
+            firma = detector.firma(t)
+            if not detector.es_duplicado(t, firma):
+                detector.agregar(t, firma)
+        comparaciones[0] = detector.comparaciones
+
+    tipos = ("cliente", "competidor", "partner")
+    noticias: Dict[str, List["main.Noticia"]] = {t: [] for t in tipos}
+    for i, (entidad, a) in enumerate(articulos):
+        tipo = tipos[i % 3]
+        noticias[tipo].append(main.Noticia(
+            tipo, entidad, main.temas_a_bits(["plan", "cloud"]), a.get("title", ""), a.get("url", ""),
+            fecha=main.get_published(a), fuente=a["publisher"]["title"],
+        ))
+
+    def etapa_html():
+        main.construir_html(noticias["cliente"], noticias["competidor"], noticias["partner"])
+
+    def etapa_texto():
+        main.construir_texto(noticias["cliente"], noticias["competidor"], noticias["partner"])
+
+    resultados.append(medir("allowed_source", n, etapa_allowed_source, memoria))
+    resultados.append(medir("contiene_palabra_prohibida", n, etapa_prohibidas, memoria))
+    resultados.append(medir("keywords", n, etapa_keywords, memoria))
+    resultados.append(medir(f"entidades[{len(entidades)}]", n, etapa_entidades, memoria))
+    resultados.append(medir("dedup", n, etapa_dedup, memoria))
+    resultados[-1]["comparaciones_por_titulo"] = round(comparaciones[0] / n, 3) if n else 0.0
+    resultados.append(medir("construir_html", n, etapa_html, memoria))
+    resultados.append(medir("construir_texto", n, etapa_texto, memoria))
+    return resultados
+
+
+class _SumideroSMTP(socketserver.StreamRequestHandler):
+    """Servidor SMTP mínimo que acepta y descarta todo (sustituto local para medir envíos)."""
+
+    def handle(self) -> None:
+        self.wfile.write(b"220 benchmark ESMTP\r\n")
+        en_datos = False
+        for linea in self.rfile:
+            if en_datos:
+                if linea == b".\r\n":
+                    en_datos = False
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            orden = linea[:4].upper()
+            if orden == b"DATA":
+                en_datos = True
+                self.wfile.write(b"354 Fin con <CRLF>.<CRLF>\r\n")
+            elif orden == b"QUIT":
+                self.wfile.write(b"221 Adios\r\n")
+                return
+            elif orden == b"EHLO":
+                self.wfile.write(b"250-localhost\r\n250 8BITMIME\r\n")
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+def ejecutar_smtp(mensajes: int, articulos: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Throughput de envío: una sesión reutilizada frente a una conexión por mensaje."""
+    servidor = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SumideroSMTP)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, port = servidor.server_address[:2]
+
+    noticias = [main.Noticia(
+        "cliente", entidad, main.temas_a_bits(["plan"]), a.get("title", ""), a.get("url", ""),
+        fecha=main.get_published(a), fuente=a["publisher"]["title"],
+    ) for entidad, a in articulos[:100]]
+    destinatarios = ["equipo@ejemplo.com"]
+    msg = main.construir_mensaje({"cliente": noticias}, destinatarios)
+
+    def nueva_entrega() -> "main.EntregaSMTP":
+        return main.EntregaSMTP(host, port, 10, starttls=False, usuario="bench@ejemplo.com", reintentos=0)
+
+    def etapa_sesion():
+        with nueva_entrega() as entrega:
+            for _ in range(mensajes):
+                entrega.enviar(msg, destinatarios)
+
+    def etapa_conexion_por_mensaje():
+        for _ in range(mensajes):
+            with nueva_entrega() as entrega:
+                entrega.enviar(msg, destinatarios)
+
+    try:
+        return [
+            medir("smtp_sesion", mensajes, etapa_sesion, False),
+            medir("smtp_conexion_por_mensaje", mensajes, etapa_conexion_por_mensaje, False),
+        ]
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def comprobar_escalado(resultados: List[Dict[str, Any]], crecimiento_maximo: float = 2.0) -> int:
+    """Comprueba que las comparaciones por titular de la dedup no crecen con el corpus.
+
+    Para cada nº de entidades compara la escala mayor con la menor. Devuelve el nº de fallos.
+    """
+    por_entidades: Dict[str, List[Dict[str, Any]]] = {}
+    for r in resultados:
+        if r["etapa"] == "dedup" and "comparaciones_por_titulo" in r:
+            por_entidades.setdefault(r["escenario"].rsplit("x", 1)[-1], []).append(r)
+    fallos = 0
+    print("\nComparaciones por titular en la dedup:")
+    for ne, grupo in sorted(por_entidades.items()):
+        if len(grupo) < 2:
+            continue
+        grupo.sort(key=lambda r: r["n"])
+        menor, mayor = grupo[0], grupo[-1]
+        # Con muy pocas comparaciones la proporción es ruido: se admite al menos una décima por titular
+        limite = max(menor["comparaciones_por_titulo"] * crecimiento_maximo, 0.1)
+        marca = "✅"
+        if mayor["comparaciones_por_titulo"] > limite:
+            marca = "❌"
+            fallos += 1
+        detalle = " → ".join(f"{r['n']}: {r['comparaciones_por_titulo']:.2f}" for r in grupo)
+        print(f"  {marca} {ne} entidades  {detalle}")
+    return fallos
+
+
+def _nucleos() -> int:
+    """Núcleos disponibles para el proceso (la afinidad cuenta en contenedores y taskset)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def comparar(actual: Dict[str, Any], baseline: Dict[str, Any], tolerancia: float) -> int:
+    """Compara throughput por (escenario, etapa). Devuelve el nº de regresiones.
+
+    Si la baseline se midió con otro nº de núcleos los tiempos no son comparables:
+    se muestran las proporciones pero no cuentan como regresiones.
+    """
+    previos = {(r["escenario"], r["etapa"]): r for r in baseline.get("resultados", [])}
+    regresiones = 0
+    print("\nComparación con baseline:")
+    otra_maquina = baseline.get("nucleos") != actual.get("nucleos")
+    if otra_maquina:
+        print(f"  ⚠️ Baseline medida con {baseline.get('nucleos', '?')} núcleo(s) y esta ejecución con "
+              f"{actual.get('nucleos')}: solo informativo")
+    for r in actual["resultados"]:
+        b = previos.get((r["escenario"], r["etapa"]))
+        if not b or not b.get("por_segundo") or not r.get("por_segundo"):
+            continue
+        ratio = r["por_segundo"] / b["por_segundo"]
+        marca = "✅"
+        if ratio < 1.0 - tolerancia:
+            if otra_maquina:
+                marca = "⚠️"
+            else:
+                marca = "❌"
+                regresiones += 1
+        print(f"  {marca} {r['escenario']:<18} {r['etapa']:<28} {ratio:6.2f}x")
+    return regresiones
+
+
+def main_cli(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articulos", default="1000,10000,100000", help="tamaños de corpus separados por comas")
+    parser.add_argument("--entidades", default="50,500", help="nº de entidades separados por comas")
+    parser.add_argument("--corpus", default="", help="corpus grabado (jsonl.gz) en lugar de datos sintéticos")
+    parser.add_argument("--smtp", type=int, default=200, help="mensajes a enviar al SMTP local (0 = no medir)")
+    parser.add_argument("--sin-memoria", action="store_true", help="no medir el pico de memoria")
+    parser.add_argument("--salida", default="", help="guardar los resultados de esta ejecución en JSON")
+    parser.add_argument("--guardar-baseline", default="", help="guardar los resultados como baseline")
+    parser.add_argument("--comparar", default="", help="baseline JSON con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="caída de throughput admitida (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    # Sin red ni ruido por consola: las redirecciones de Google se decodifican en local
+    main.DEBUG_SOURCES = False
+    main.REDIRECT_CACHE_PATH = ""
+    main.cargar_config()
+
+    escalas = [int(x) for x in args.articulos.split(",") if x.strip()]
+    num_entidades = [int(x) for x in args.entidades.split(",") if x.strip()]
+    informe: Dict[str, Any] = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "procesador": platform.processor() or platform.machine(),
+        "nucleos": _nucleos(),
+        "resultados": [],
+    }
+
+    rnd = random.Random(7)
+    for ne in num_entidades:
+        entidades = entidades_sinteticas(ne, rnd)
+        for n in escalas:
+            escenario = f"{'corpus' if args.corpus else 'sint'}-{n}x{ne}"
+            print(f"\n▶ {escenario}")
+            articulos = articulos_de_corpus(args.corpus, n) if args.corpus else articulos_sinteticos(n, entidades)
+            for r in ejecutar_escala(articulos, entidades, not args.sin_memoria):
+                r["escenario"] = escenario
+                informe["resultados"].append(r)
+
+    if args.smtp:
+        print(f"\n▶ smtp-{args.smtp}")
+        for r in ejecutar_smtp(args.smtp, articulos_sinteticos(100, entidades_sinteticas(10, rnd))):
+            r["escenario"] = f"smtp-{args.smtp}"
+            informe["resultados"].append(r)
+
+    for destino in (args.salida, args.guardar_baseline):
+        if destino:
+            carpeta = os.path.dirname(destino)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            with open(destino, "w", encoding="utf-8") as f:
+                json.dump(informe, f, ensure_ascii=False, indent=2)
+            print(f"\n💾 Resultados guardados en {destino}")
+
+    if comprobar_escalado(informe["resultados"]):
+        print("\n❌ Las comparaciones por titular de la dedup crecen con el corpus")
+        return 1
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regresiones = comparar(informe, baseline, args.tolerancia)
+        if regresiones:
+            print(f"\n❌ {regresiones} etapa(s) por debajo de la baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli(sys.argv[1:]))
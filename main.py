@@ -1,717 +1,4025 @@
-import os
-import smtplib
-import re
-import time
-import random
-from difflib import SequenceMatcher
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.utils import formatdate, make_msgid
-from gnews import GNews
-from datetime import datetime
-from typing import List, Dict, Any, Tuple
-from urllib.parse import urlparse
-from functools import lru_cache
-
-import requests
-
-# =========================
-# 1) CONFIGURACIÓN (ENV)
-# =========================
-EMAIL_USER = os.environ.get("EMAIL_USER", "").strip()
-EMAIL_PASS = os.environ.get("EMAIL_PASS", "").strip()
-EMAIL_TO_RAW = os.environ.get("EMAIL_TO", "").strip()
-
-SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com").strip()
-SMTP_PORT = int(os.environ.get("SMTP_PORT", "587").strip() or 587)
-SMTP_TIMEOUT = int(os.environ.get("SMTP_TIMEOUT", "20").strip() or 20)
-
-# DEBUG
-DEBUG_SOURCES = True  # pon False cuando ya funcione
-
-# =========================
-# 2) CLIENTES, COMPETIDORES Y PARTNERS
-# =========================
-CLIENTES = [
-    "Banco Sabadell", "BBVA", "CaixaBank", "Iberdrola", "Airbus",
-    "Repsol", "Banco Santander", "Amadeus", "EDP", "Masorange",
-    "El Corte Inglés", "Endesa", "Mapfre", "Telefónica", "Vodafone",
-    "Moeve", "Ibercaja", "Naturgy", "Bankinter", "Red Eléctrica", "Redeia",
-    "Antonio Puig", "Inditex", "Gestamp", "Mutua Madrileña", "Ferrovial", 
-    "Unicaja", "Antolin", "Mahou", "Kutxabank", "Altice",
-    "Acciona", "Galp", "Navantia",
-]
-
-COMPETIDORES = [
-    "NTT Data", "Deloitte", "Capgemini", "Inetum",
-    "Kyndryl", "EY", "DXC", "Indra", "Minsait", "KPMG", "PWC", "WPP", "BCG", "Mckinsey", 
-]
-
-PARTNERS = [
-    "Microsoft",
-    "Google",
-    "AWS",
-    "Salesforce",
-    "SAP",
-    "ServiceNow",
-    "Oracle",
-    "IBM",
-    "Databricks",
-    "Workday",
-]
-
-# =========================
-# 3) PALABRAS CLAVE
-# =========================
-KEYWORDS_EXACTAS = [
-    # Cargos clave (movimiento de poder)
-    "CEO",
-    "CIO",
-    "CTO",
-
-    # Tecnología core estratégica
-    "ERP",
-    "SAP",
-    "RPA",
-    "IPO",
-    "OPA"
-]
-
-KEYWORDS_GENERALES = [
-
-    # --- Inversión / Oportunidad ---
-    "inversión",
-    "invertirá",
-    "invertirá en",
-    "destina",
-    "destinará",
-    "licita",
-    "licitación",
-    "adjudica",
-    "adjudicación",
-    "adjudicatario",
-    "contrato",
-    "renovación de contrato",
-    "extensión de contrato",
-    "acuerdo marco",
-    "acuerdo plurianual",
-    "concurso público",
-    "pliego",
-    "rfp",
-    "rfi",
-    "tender",
-    "solicitud de ofertas",
-    "proceso competitivo",
-    "convocatoria",
-    "plan",
-    "plan estratégico",
-    "plan de transformación",
-    "programa estratégico",
-    "programa de eficiencia",
-    "plan de reducción de costes",
-    "plan de ahorro",
-    "presupuesto",
-    "capex",
-    "opex",
-    "roadmap",
-    "revisión estratégica",
-    "spin-off",
-    "escisión",
-    "carve-out",
-    "integración tras adquisición",
-
-    # --- Verbos de acción frecuentes en prensa ---
-    "lanza",
-    "lanza plan",
-    "impulsa",
-    "impulsará",
-    "pone en marcha",
-    "activa",
-    "aprueba",
-    "autoriza",
-    "moderniza",
-    "renueva",
-    "renovará",
-    "actualiza",
-    "digitaliza",
-    "digitalización",
-    "transformación digital",
-    "nuevo sistema",
-    "nueva plataforma",
-    "nuevo modelo operativo",
-    "externaliza",
-    "subcontrata",
-    "implementa",
-    "implementará",
-    "implantará",
-    "despliega",
-    "desarrollará",
-
-    # --- Tecnología core Accenture ---
-    "ChatGPT",
-    "OpenAI",
-    "Gemini",
-    "inteligencia artificial",
-    "ia generativa",
-    "inteligencia generativa",
-    "genai",
-    "machine learning",
-    "big data",
-    "analytics",
-    "analítica avanzada",
-    "data platform",
-    "data governance",
-    "gobierno del dato",
-    "modernización tecnológica",
-    "core bancario",
-    "erp",
-    "sap",
-    "s/4hana",
-    "salesforce",
-    "servicenow",
-    "oracle",
-    "migración",
-    "migración a la nube",
-    "cloud",
-    "cloud híbrido",
-    "nube híbrida",
-    "multi-cloud",
-    "infraestructura cloud",
-    "infraestructura tecnológica",
-    "infraestructura digital",
-    "data center",
-    "centro de datos",
-    "automatización",
-    "automatización inteligente",
-    "automatización de procesos",
-    "rpa",
-    "hyperautomation",
-    "low code",
-    "plataforma digital",
-    "plataforma tecnológica",
-    "software corporativo",
-    "ciberseguridad",
-    "ciberresiliencia",
-    "zero trust",
-    "identidad digital",
-    "blockchain",
-
-    # --- Organización / Movimiento ejecutivo ---
-    "nuevo ceo",
-    "nuevo cio",
-    "nuevo cto",
-    "nuevo ciso",
-    "nombramiento",
-    "relevo",
-    "cese",
-    "reestructuración",
-    "cambio organizativo",
-    "dirección digital",
-    "dirección de tecnología",
-    "transformación organizativa",
-
-    # --- ESG / Regulación ---
-    "esg",
-    "csrd",
-    "taxonomía europea",
-    "reporting esg",
-    "descarbonización",
-    "huella de carbono",
-    "eficiencia energética",
-    "hidrógeno",
-    "movilidad eléctrica",
-    "regulación",
-    "normativa",
-    "cumplimiento normativo",
-    "compliance",
-    "supervisión",
-    "requerimientos regulatorios",
-    "resiliencia operativa",
-    "dora",
-    "basel iii",
-    "regulatory framework",
-
-    # --- Incidentes / Riesgo ---
-    "fallo tecnológico",
-    "colapso del sistema",
-    "interrupción del servicio",
-    "caída del sistema",
-    "problemas informáticos",
-    "brecha de seguridad",
-    "ataque informático",
-    "ciberataque",
-    "ransomware",
-    "filtración de datos",
-    "data breach",
-    "cyber attack",
-    "ransomware attack",
-    "it outage",
-    "system failure",
-
-    # --- Alianzas ---
-    "alianza estratégica",
-    "joint venture",
-    "colaboración",
-    "partnership",
-    "acuerdo tecnológico",
-    "selecciona a",
-    "elige a",
-    "partners with",
-    "awards contract",
-    "awarded contract",
-
-    # --- Modelo operativo ---
-    "outsourcing",
-    "bpo",
-    "managed services",
-    "centro de excelencia",
-    "coe",
-    "hub tecnológico",
-    "digital factory",
-
-    # --- English expansion ---
-    "investment",
-    "to invest",
-    "launches",
-    "rolls out",
-    "deploys",
-    "implements",
-    "selects",
-    "appoints",
-    "transformation program",
-    "digital transformation",
-    "modernization",
-    "cloud migration",
-    "core system upgrade",
-    "erp implementation",
-    "technology upgrade",
-    "cost reduction plan",
-    "efficiency program",
-    "it overhaul"
-]
-
-
-# =========================
-# 4) PALABRAS PROHIBIDAS
-# =========================
-PALABRAS_PROHIBIDAS = [
-    "fútbol", "futbol", "liga", "champions", "gol", "partido", "alineación",
-    "fichaje", "entrenador", "baloncesto", "tenis", "nadal", "alonso",
-    "sucesos", "accidente", "lotería"
-]
-
-# =========================
-# 5) WHITELISTS (SEPARADAS)
-# =========================
-ALLOWED_DOMAINS = {
-    # Generalistas
-    "elpais.com",
-    "elmundo.es",
-    "abc.es",
-    "20minutos.es",
-    "eldiario.es",
-    "elespanol.com",
-    "larazon.es",
-    "lavanguardia.com",
-    "madridiario.es",
-    "levante-emv.com",
-    "diariodesevilla.es",
-    "elcorreo.com",
-    "elnortedecastilla.es",
-    "heraldo.es",
-    "laverdad.es",
-    "diariodemallorca.es",
-    "canarias7.es",
-    "diariodenavarra.es",
-    "diariomontanes.es",
-    "RTVE.es",
-    "ElPlural.com",
-    "Finanzas.com",
-    "eldiariocantabria.es",
-
-    # Económicos / empresa
-    "expansion.com",
-    "cincodias.elpais.com",
-    "cincodias.com",
-    "eleconomista.es",
-    "elconfidencial.com",
-    "capitalmadrid.com",
-
-    # Internacionales
-    "reuters.com",
-    "bloomberg.com",
-    "ft.com",
-    "wsj.com",
-}
-
-ALLOWED_PUBLISHERS = {
-    "El País", "EL PAÍS",
-    "El Mundo", "EL MUNDO",
-    "ABC",
-    "20minutos",
-    "elDiario.es",
-    "EL ESPAÑOL", "El Español",
-    "La Razón",
-    "La Vanguardia",
-    "Expansión",
-    "Cinco Días",
-    "elEconomista.es", "El Economista", "elEconomista",
-    "El Confidencial",
-    "Capital Madrid",
-    "Diario de Sevilla",
-    "Heraldo de Aragón", "Heraldo",
-    "El Norte de Castilla",
-    "El Correo",
-    "La Verdad",
-    "Diario de Mallorca",
-    "Canarias7", "Canarias 7",
-    "Diario de Navarra",
-    "El Diario Montañés",
-    "El Periódico",
-    "Cadena SER",
-    "COPE",
-    "Faro de Vigo",
-    "Europa Press",
-    "La Voz de Galicia",
-    "RTVE.es",
-    "ElPlural.com",
-    "Finanzas.com",
-    "eldiariocantabria.es",
-    "Infodefensa",
-}
-
-BLOCKED_DOMAINS = set()
-
-# ✅ MUST CHANGE #1: Normalizar dominios a minúsculas
-ALLOWED_DOMAINS = {d.strip().lower() for d in ALLOWED_DOMAINS}
-BLOCKED_DOMAINS = {d.strip().lower() for d in BLOCKED_DOMAINS}
-
-def debug_log(msg: str) -> None:
-    if DEBUG_SOURCES:
-        print(msg)
-
-def norm(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "").strip().lower())
-
-ALLOWED_PUBLISHERS_NORM = {norm(x) for x in ALLOWED_PUBLISHERS}
-
-EMAIL_REGEX = re.compile(r"^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$", re.IGNORECASE)
-
-_HTTP = requests.Session()
-_HTTP.headers.update({"User-Agent": "Mozilla/5.0"})
-
-def _netloc(url: str) -> str:
-    try:
-        netloc = urlparse(url).netloc.lower()
-        if netloc.startswith("www."):
-            netloc = netloc[4:]
-        return netloc
-    except Exception:
-        return ""
-
-def _looks_like_google_redirect(url: str) -> bool:
-    host = _netloc(url)
-    return any(x in host for x in ("news.google.com", "news.googleusercontent.com", "google.com"))
-
-@lru_cache(maxsize=5000)
-def resolve_final_url(url: str) -> str:
-    try:
-        if not _looks_like_google_redirect(url):
-            return url
-        r = _HTTP.get(url, allow_redirects=True, timeout=10)
-        return r.url or url
-    except Exception:
-        return url
-
-def allowed_source(articulo: Dict[str, Any]) -> Tuple[bool, str, str, str]:
-    url = (articulo.get("url") or articulo.get("link") or "").strip()
-    publisher_raw = ((articulo.get("publisher") or {}).get("title") or "").strip()
-
-    final_url = resolve_final_url(url)
-    dom = _netloc(final_url)
-
-    if dom and any(dom == b or dom.endswith("." + b) for b in BLOCKED_DOMAINS):
-        return False, dom, final_url, publisher_raw
-
-    if dom == "news.google.com":
-        pub_ok = norm(publisher_raw) in ALLOWED_PUBLISHERS_NORM
-        return pub_ok, dom, final_url, publisher_raw
-
-    dom_ok = any(dom == a or dom.endswith("." + a) for a in ALLOWED_DOMAINS)
-    return dom_ok, dom, final_url, publisher_raw
-
-def parse_recipients(raw: str) -> List[str]:
-    if not raw:
-        return []
-    parts = re.split(r"[;,]", raw)
-    emails = []
-    for p in parts:
-        e = p.strip()
-        if e and EMAIL_REGEX.match(e):
-            emails.append(e)
-    seen = set()
-    out = []
-    for e in emails:
-        if e not in seen:
-            out.append(e)
-            seen.add(e)
-    return out
-
-def validate_env(recipients: List[str]) -> None:
-    if not EMAIL_USER:
-        raise RuntimeError("Falta la variable de entorno EMAIL_USER.")
-    if not EMAIL_PASS:
-        raise RuntimeError("Falta la variable de entorno EMAIL_PASS.")
-    if not recipients:
-        raise RuntimeError("Falta EMAIL_TO o no hay destinatarios válidos (separa por comas o ;).")
-
-def contiene_palabra_prohibida(texto: str) -> bool:
-    for prohibida in PALABRAS_PROHIBIDAS:
-        if re.search(r"\b" + re.escape(prohibida) + r"\b", texto):
-            return True
-    return False
-
-def es_similar(a: str, b: str) -> bool:
-    return SequenceMatcher(None, a, b).ratio() > 0.65
-
-# ✅ MUST CHANGE #3: published date robusto
-def get_published(articulo: Dict[str, Any]) -> str:
-    return (
-        articulo.get("published date")
-        or articulo.get("published_date")
-        or articulo.get("pubDate")
-        or articulo.get("published")
-        or "N/D"
-    )
-
-def buscar_y_filtrar_entidades(entidades: List[str], tipo: str) -> List[Dict[str, Any]]:
-    google_news = GNews(language="es", country="ES", period="1d", max_results=100)
-
-    noticias_relevantes: List[Dict[str, Any]] = []
-    titulos_vistos: List[str] = []
-
-    for i, entidad in enumerate(entidades):
-        try:
-            time.sleep(random.uniform(1.0, 2.0))
-            print(f"[{i+1}/{len(entidades)}] 🔹 {entidad} ({tipo})...", end="")
-            resultados = google_news.get_news(entidad)
-            print(f" {len(resultados)} analizadas.")
-
-            for articulo in resultados:
-                titulo = (articulo.get("title") or "").strip()
-                descripcion = articulo.get("description") or ""
-                if not titulo:
-                    continue
-
-                url = (articulo.get("url") or articulo.get("link") or "").strip()
-                if not url:
-                    continue
-
-                allowed, dom, final_url, publisher = allowed_source(articulo)
-                if not allowed:
-                    debug_log(f"    ⛔ RECHAZADA (medio) dom={dom} publisher='{publisher}' url={final_url[:120]}")
-                    continue
-                debug_log(f"    ✅ OK (medio) dom={dom} publisher='{publisher}'")
-
-                texto_analizar = (titulo + " " + descripcion).lower()
-
-                if contiene_palabra_prohibida(texto_analizar):
-                    debug_log(f"    ⛔ RECHAZADA (prohibidas) '{titulo[:80]}'")
-                    continue
-
-                if any(es_similar(titulo.lower(), t.lower()) for t in titulos_vistos):
-                    debug_log(f"    ⛔ RECHAZADA (duplicada) '{titulo[:80]}'")
-                    continue
-
-                temas_encontrados = []
-                for kw in KEYWORDS_GENERALES:
-                    if kw.lower() in texto_analizar:
-                        temas_encontrados.append(kw)
-
-                for kw in KEYWORDS_EXACTAS:
-                    patron = r"\b" + re.escape(kw.lower()) + r"\b"
-                    if re.search(patron, texto_analizar):
-                        temas_encontrados.append(kw)
-
-                if not temas_encontrados:
-                    debug_log(f"    ⛔ RECHAZADA (sin keywords) '{titulo[:80]}'")
-                    continue
-
-                titulos_vistos.append(titulo)
-                temas_str = ", ".join(sorted(set(temas_encontrados), key=str.lower)).upper()
-
-                noticias_relevantes.append({
-                    "tipo": tipo,
-                    "entidad": entidad,
-                    "temas": temas_str,
-                    "titulo": titulo,
-                    "url": final_url,
-                    "fecha": get_published(articulo),
-                    "fuente": publisher or dom or "Google News",
-                    "dominio": dom,
-                })
-
-        except Exception as e:
-            print(f"⚠️ Error {entidad} ({tipo}): {e}")
-
-    return noticias_relevantes
-
-def construir_html(
-    noticias_clientes: List[Dict[str, Any]],
-    noticias_competidores: List[Dict[str, Any]],
-    noticias_partners: List[Dict[str, Any]],
-) -> str:
-    noticias_clientes.sort(key=lambda x: x["entidad"])
-    noticias_competidores.sort(key=lambda x: x["entidad"])
-    noticias_partners.sort(key=lambda x: x["entidad"])
-
-    total_clientes = len(noticias_clientes)
-    total_competidores = len(noticias_competidores)
-    total_partners = len(noticias_partners)
-    total = total_clientes + total_competidores + total_partners
-
-    html = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px;">
-        <div style="max-width: 680px; margin: 0 auto; background-color: #ffffff; padding: 20px; border-radius: 8px;">
-            <h2 style="color: #2c3e50;">📊 Reporte Diario Noticias Accenture</h2>
-            <p>
-                Se han detectado <strong>{total}</strong> noticias relevantes hoy
-                (<strong>Clientes:</strong> {total_clientes} |
-                 <strong>Competidores:</strong> {total_competidores} |
-                 <strong>Partners:</strong> {total_partners}).
-            </p>
-            <hr>
-    """
-
-    # -------- BLOQUE CLIENTES --------
-    html += f"""
-        <h2 style="color:#2c3e50; margin-top: 10px;">🧩 Noticias de Clientes</h2>
-        <p style="color:#666; font-size:12px;">Total: <strong>{total_clientes}</strong></p>
-        <hr>
-    """
-
-    if not noticias_clientes:
-        html += "<p style='color:#888;'>No se han encontrado noticias de clientes con los filtros actuales.</p>"
-    else:
-        current = ""
-        for n in noticias_clientes:
-            if n["entidad"] != current:
-                html += f"<h3 style='background-color: #eee; color: #333; padding: 8px; margin-top: 20px;'>{n['entidad']}</h3>"
-                current = n["entidad"]
-
-            html += f"""
-            <div style="margin-bottom: 15px; border-left: 3px solid #2980b9; padding-left: 10px;">
-                <div style="font-size: 10px; color: #e67e22; font-weight: bold;">{n.get("temas","")}</div>
-                <a href="{n.get("url","")}" style="font-size: 14px; font-weight: bold; color: #333; text-decoration: none;">{n.get("titulo","")}</a>
-                <div style="font-size: 11px; color: #888;">{n.get("fuente","")} - {n.get("fecha","N/D")}</div>
-            </div>
-            """
-
-    # -------- BLOQUE COMPETIDORES --------
-    html += f"""
-        <hr style="margin-top: 25px;">
-        <h2 style="color:#2c3e50;">🥊 Noticias de Competidores</h2>
-        <p style="color:#666; font-size:12px;">Total: <strong>{total_competidores}</strong></p>
-        <hr>
-    """
-
-    if not noticias_competidores:
-        html += "<p style='color:#888;'>No se han encontrado noticias de competidores con los filtros actuales.</p>"
-    else:
-        current = ""
-        for n in noticias_competidores:
-            if n["entidad"] != current:
-                html += f"<h3 style='background-color: #eee; color: #333; padding: 8px; margin-top: 20px;'>{n['entidad']}</h3>"
-                current = n["entidad"]
-
-            html += f"""
-            <div style="margin-bottom: 15px; border-left: 3px solid #8e44ad; padding-left: 10px;">
-                <div style="font-size: 10px; color: #e67e22; font-weight: bold;">{n.get("temas","")}</div>
-                <a href="{n.get("url","")}" style="font-size: 14px; font-weight: bold; color: #333; text-decoration: none;">{n.get("titulo","")}</a>
-                <div style="font-size: 11px; color: #888;">{n.get("fuente","")} - {n.get("fecha","N/D")}</div>
-            </div>
-            """
-
-    # -------- BLOQUE PARTNERS --------
-    html += f"""
-        <hr style="margin-top: 25px;">
-        <h2 style="color:#2c3e50;">🤝 Noticias de Partners</h2>
-        <p style="color:#666; font-size:12px;">Total: <strong>{total_partners}</strong></p>
-        <hr>
-    """
-
-    if not noticias_partners:
-        html += "<p style='color:#888;'>No se han encontrado noticias de partners con los filtros actuales.</p>"
-    else:
-        current = ""
-        for n in noticias_partners:
-            if n["entidad"] != current:
-                html += f"<h3 style='background-color: #eee; color: #333; padding: 8px; margin-top: 20px;'>{n['entidad']}</h3>"
-                current = n["entidad"]
-
-            html += f"""
-            <div style="margin-bottom: 15px; border-left: 3px solid #16a085; padding-left: 10px;">
-                <div style="font-size: 10px; color: #e67e22; font-weight: bold;">{n.get("temas","")}</div>
-                <a href="{n.get("url","")}" style="font-size: 14px; font-weight: bold; color: #333; text-decoration: none;">{n.get("titulo","")}</a>
-                <div style="font-size: 11px; color: #888;">{n.get("fuente","")} - {n.get("fecha","N/D")}</div>
-            </div>
-            """
-
-    html += "</div></body></html>"
-    return html
-
-def enviar_correo(
-    noticias_clientes: List[Dict[str, Any]],
-    noticias_competidores: List[Dict[str, Any]],
-    noticias_partners: List[Dict[str, Any]],
-    recipients: List[str]
-) -> None:
-    if not noticias_clientes and not noticias_competidores and not noticias_partners:
-        print("\n📭 Informe vacío (se enviará correo igualmente).")
-
-    html = construir_html(noticias_clientes, noticias_competidores, noticias_partners)
-
-    msg = MIMEMultipart()
-    msg["From"] = EMAIL_USER
-    # ✅ MUST CHANGE #2: cabecera To correcta
-    msg["To"] = ", ".join(recipients)
-
-    total = len(noticias_clientes) + len(noticias_competidores) + len(noticias_partners)
-    msg["Subject"] = (
-        f"🚀 Reporte Diario: {total} noticias "
-        f"(Clientes {len(noticias_clientes)} | "
-        f"Competidores {len(noticias_competidores)} | "
-        f"Partners {len(noticias_partners)})"
-    )
-    msg["Date"] = formatdate(localtime=True)
-    msg["Message-ID"] = make_msgid(domain=None)
-
-    msg.attach(MIMEText(html, "html", "utf-8"))
-
-    try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.sendmail(EMAIL_USER, recipients, msg.as_string())
-
-        print(f"✅ Correo enviado a {len(recipients)} destinatario(s): {', '.join(recipients)}")
-    except Exception as e:
-        print(f"❌ Error enviando correo: {e}")
-
-if __name__ == "__main__":
-    print(f"🚀 AGENTE NUBE (PRO): {datetime.now().strftime('%H:%M:%S')}")
-    recipients = parse_recipients(EMAIL_TO_RAW)
-    validate_env(recipients)
-
-    noticias_clientes = buscar_y_filtrar_entidades(CLIENTES, "cliente")
-    noticias_competidores = buscar_y_filtrar_entidades(COMPETIDORES, "competidor")
-    noticias_partners = buscar_y_filtrar_entidades(PARTNERS, "partner")
-
-    enviar_correo(noticias_clientes, noticias_competidores, noticias_partners, recipients)
-
-
-
-
+import os
+import base64
+import binascii
+import smtplib
+import re
+import time
+import random
+import threading
+import sqlite3
+import queue
+import multiprocessing
+import zlib
+import math
+import heapq
+import hashlib
+import gzip
+import json
+import signal
+import sys
+import argparse
+import unicodedata
+from difflib import SequenceMatcher
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formatdate, make_msgid, parsedate_to_datetime
+from gnews import GNews
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Optional, Tuple, Union
+from collections import deque
+from urllib.parse import urljoin, urlparse
+from functools import lru_cache
+from html import escape
+from html.parser import HTMLParser
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+
+try:
+    import feedparser  # dependencia de gnews
+except ImportError:  # pragma: no cover
+    feedparser = None
+
+try:
+    import yaml  # opcional: solo para CONFIG_PATH en .yaml/.yml
+except ImportError:  # pragma: no cover
+    yaml = None
+
+# =========================
+# 1) CONFIGURACIÓN (ENV)
+# =========================
+EMAIL_USER = os.environ.get("EMAIL_USER", "").strip()
+EMAIL_PASS = os.environ.get("EMAIL_PASS", "").strip()
+EMAIL_TO_RAW = os.environ.get("EMAIL_TO", "").strip()
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com").strip()
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587").strip() or 587)
+SMTP_TIMEOUT = int(os.environ.get("SMTP_TIMEOUT", "20").strip() or 20)
+# Para un servidor SMTP local de pruebas: SMTP_STARTTLS=0 y SMTP_AUTH=0
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1").strip() != "0"
+SMTP_AUTH = os.environ.get("SMTP_AUTH", "1").strip() != "0"
+# Reintentos ante errores SMTP transitorios (4xx, desconexión, timeout) con backoff exponencial
+SMTP_RETRIES = int(os.environ.get("SMTP_RETRIES", "3").strip() or 0)
+SMTP_BACKOFF_S = float(os.environ.get("SMTP_BACKOFF_S", "2").strip() or 2)
+# Informes segmentados: EMAIL_TO_CLIENTE, EMAIL_TO_COMPETIDOR y EMAIL_TO_PARTNER reciben solo
+# su sección (quien esté en varias, una sola versión con todas ellas). EMAIL_TO recibe el completo.
+
+# Grabación / reproducción de tráfico (NOTICIAS_MODO = "", "record" o "replay")
+NOTICIAS_MODO = os.environ.get("NOTICIAS_MODO", "").strip().lower()
+NOTICIAS_CORPUS = os.environ.get("NOTICIAS_CORPUS", "corpus/noticias.jsonl.gz").strip()
+
+# Métricas de la ejecución (vacío = no se exportan)
+METRICS_JSON = os.environ.get("METRICS_JSON", "").strip()
+METRICS_PROM = os.environ.get("METRICS_PROM", "").strip()
+
+# Descarga concurrente de GNews (límite compartido entre hilos)
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "4").strip() or 4)
+FETCH_RPS = float(os.environ.get("FETCH_RPS", "0.7").strip() or 0.7)
+FETCH_BURST = int(os.environ.get("FETCH_BURST", "2").strip() or 2)
+
+# Control adaptativo (AIMD) del ritmo y la concurrencia contra Google, y cortacircuitos.
+# FETCH_RPS y FETCH_WORKERS son los techos; ante 429/503, timeouts o lentitud se bajan a la mitad.
+ADAPT_RPS_MIN = float(os.environ.get("ADAPT_RPS_MIN", "0.1").strip() or 0.1)
+ADAPT_PASO_RPS = float(os.environ.get("ADAPT_PASO_RPS", "0.05").strip() or 0.05)
+ADAPT_LATENCIA_LENTA_S = float(os.environ.get("ADAPT_LATENCIA_LENTA_S", "15").strip() or 15)
+CIRCUIT_FALLOS = int(os.environ.get("CIRCUIT_FALLOS", "3").strip() or 3)
+CIRCUIT_ENFRIAMIENTO_S = float(os.environ.get("CIRCUIT_ENFRIAMIENTO_S", "60").strip() or 60)
+# Pasadas extra para las consultas que fallaron y espera máxima por pasada a que cierre el circuito
+GNEWS_PASADAS_REINTENTO = int(os.environ.get("GNEWS_PASADAS_REINTENTO", "2").strip() or 0)
+GNEWS_REINTENTO_MAX_ESPERA_S = float(os.environ.get("GNEWS_REINTENTO_MAX_ESPERA_S", "300").strip() or 300)
+
+# Consultas OR agrupando entidades (1 = una consulta por entidad, como antes)
+GNEWS_BATCH_ENTIDADES = int(os.environ.get("GNEWS_BATCH_ENTIDADES", "1").strip() or 1)
+GNEWS_BATCH_MAX_CHARS = int(os.environ.get("GNEWS_BATCH_MAX_CHARS", "200").strip() or 200)
+
+# Ediciones de Google News (idioma-PAÍS) que se consultan para todas las entidades; algunas
+# entidades añaden las suyas en LOCALES_POR_ENTIDAD. La primera es la edición base.
+GNEWS_LOCALES = [l.strip() for l in os.environ.get("GNEWS_LOCALES", "es-ES").split(",") if l.strip()] or ["es-ES"]
+
+# Caché persistente de redirecciones de Google News (vacío = desactivada)
+REDIRECT_CACHE_PATH = os.environ.get("REDIRECT_CACHE_PATH", ".cache/redirects.sqlite3").strip()
+REDIRECT_CACHE_TTL_DAYS = float(os.environ.get("REDIRECT_CACHE_TTL_DAYS", "30").strip() or 30)
+REDIRECT_CACHE_MAX = int(os.environ.get("REDIRECT_CACHE_MAX", "50000").strip() or 50000)
+
+# Noticias ya enviadas en días anteriores (vacío = desactivado)
+SEEN_STORE_PATH = os.environ.get("SEEN_STORE_PATH", ".cache/seen.sqlite3").strip()
+SEEN_RETENTION_DAYS = float(os.environ.get("SEEN_RETENTION_DAYS", "14").strip() or 14)
+SEEN_COMPACT_MIN_DELETED = int(os.environ.get("SEEN_COMPACT_MIN_DELETED", "5000").strip() or 5000)
+# Descarta lo publicado antes de la última ejecución correcta (menos este margen en horas)
+SEEN_WATERMARK_MARGIN_H = float(os.environ.get("SEEN_WATERMARK_MARGIN_H", "2").strip() or 2)
+
+# Relevancia: vida media de la frescura y top-K por entidad / sección (0 = sin límite)
+RELEVANCIA_VIDA_MEDIA_H = float(os.environ.get("RELEVANCIA_VIDA_MEDIA_H", "24").strip() or 24)
+TOPK_POR_ENTIDAD = int(os.environ.get("TOPK_POR_ENTIDAD", "5").strip() or 0)
+TOPK_POR_SECCION = int(os.environ.get("TOPK_POR_SECCION", "50").strip() or 0)
+
+# Pipeline en streaming: hilos por etapa y tamaño de las colas entre etapas
+PIPELINE_RESOLVE_WORKERS = int(os.environ.get("PIPELINE_RESOLVE_WORKERS", "8").strip() or 8)
+PIPELINE_FILTER_WORKERS = int(os.environ.get("PIPELINE_FILTER_WORKERS", "2").strip() or 2)
+PIPELINE_QUEUE = int(os.environ.get("PIPELINE_QUEUE", "64").strip() or 64)
+# Máximo de artículos en vuelo entre la descarga y el recolector (incluidos los que esperan
+# a que llegue uno anterior para salir en orden): la memoria no depende de la etapa más lenta
+PIPELINE_VENTANA = int(os.environ.get("PIPELINE_VENTANA", "512").strip() or 512)
+# Modo multiproceso para corpus grandes (backfill, max_results altos): keywords, prohibidas,
+# firmas MinHash y comparaciones de titulares en PIPELINE_PROCESOS procesos, por lotes.
+# 0 = todo en hilos del proceso principal, como siempre. El resultado es el mismo.
+PIPELINE_PROCESOS = int(os.environ.get("PIPELINE_PROCESOS", "0").strip() or 0)
+PIPELINE_LOTE_CPU = int(os.environ.get("PIPELINE_LOTE_CPU", "256").strip() or 256)
+
+# Enriquecimiento opcional con el texto del artículo (solo medios de la whitelist): descargas
+# en streaming con tamaño y tiempo acotados, y texto extraído cacheado por URL final.
+ENRICH_TEXTO = os.environ.get("ENRICH_TEXTO", "0").strip() == "1"
+ENRICH_WORKERS = int(os.environ.get("ENRICH_WORKERS", "8").strip() or 8)
+ENRICH_MAX_BYTES = int(os.environ.get("ENRICH_MAX_BYTES", "1000000").strip() or 1000000)
+ENRICH_MAX_CHARS = int(os.environ.get("ENRICH_MAX_CHARS", "20000").strip() or 20000)
+ENRICH_TIMEOUT_S = float(os.environ.get("ENRICH_TIMEOUT_S", "6").strip() or 6)
+# Pasado este tiempo desde el inicio del pipeline solo se usa lo que ya esté en caché
+ENRICH_PRESUPUESTO_S = float(os.environ.get("ENRICH_PRESUPUESTO_S", "60").strip() or 60)
+# Las palabras prohibidas solo se buscan en el arranque del cuerpo (titular ampliado), no en
+# todo el texto: "partido" o "liga" aparecen en muchas noticias económicas
+ENRICH_PROHIBIDAS_CHARS = int(os.environ.get("ENRICH_PROHIBIDAS_CHARS", "600").strip() or 0)
+ENRICH_CACHE_PATH = os.environ.get("ENRICH_CACHE_PATH", ".cache/textos.sqlite3").strip()
+ENRICH_CACHE_TTL_DAYS = float(os.environ.get("ENRICH_CACHE_TTL_DAYS", "14").strip() or 14)
+ENRICH_CACHE_MAX = int(os.environ.get("ENRICH_CACHE_MAX", "20000").strip() or 20000)
+
+# Histórico de noticias aceptadas y rechazos por ejecución (vacío = desactivado)
+HISTORY_PATH = os.environ.get("HISTORY_PATH", ".cache/historico.sqlite3").strip()
+
+# Modo daemon: informe diario (07:30 UTC) y barridos opcionales durante el día (cron de 5
+# campos; varias expresiones separadas por ";"). Los barridos solo envían si hay novedades.
+DAEMON_CRON = os.environ.get("DAEMON_CRON", "30 7 * * *").strip()
+DAEMON_CRON_BARRIDOS = os.environ.get("DAEMON_CRON_BARRIDOS", "").strip()
+
+# Backfill histórico: carpeta de checkpoints (un fichero por entidad × día) y procesos
+BACKFILL_DIR = os.environ.get("BACKFILL_DIR", ".cache/backfill").strip()
+BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", "4").strip() or 4)
+
+# Configuración externa (JSON, o YAML si está PyYAML): cada clave que aparezca sustituye a la
+# lista del código (clientes, competidores, partners, keywords, prohibidas, whitelists, pesos).
+# Lo compilado a partir de ella se guarda en CONFIG_CACHE_DIR con la huella del contenido.
+CONFIG_PATH = os.environ.get("CONFIG_PATH", "config.json").strip()
+CONFIG_CACHE_DIR = os.environ.get("CONFIG_CACHE_DIR", ".cache/config").strip()
+
+# DEBUG
+DEBUG_SOURCES = True  # pon False cuando ya funcione
+
+# =========================
+# 2) CLIENTES, COMPETIDORES Y PARTNERS
+# =========================
+CLIENTES = [
+    "Banco Sabadell", "BBVA", "CaixaBank", "Iberdrola", "Airbus",
+    "Repsol", "Banco Santander", "Amadeus", "EDP", "Masorange",
+    "El Corte Inglés", "Endesa", "Mapfre", "Telefónica", "Vodafone",
+    "Moeve", "Ibercaja", "Naturgy", "Bankinter", "Red Eléctrica", "Redeia",
+    "Antonio Puig", "Inditex", "Gestamp", "Mutua Madrileña", "Ferrovial", 
+    "Unicaja", "Antolin", "Mahou", "Kutxabank", "Altice",
+    "Acciona", "Galp", "Navantia",
+]
+
+COMPETIDORES = [
+    "NTT Data", "Deloitte", "Capgemini", "Inetum",
+    "Kyndryl", "EY", "DXC", "Indra", "Minsait", "KPMG", "PWC", "WPP", "BCG", "Mckinsey", 
+]
+
+PARTNERS = [
+    "Microsoft",
+    "Google",
+    "AWS",
+    "Salesforce",
+    "SAP",
+    "ServiceNow",
+    "Oracle",
+    "IBM",
+    "Databricks",
+    "Workday",
+]
+
+# Ediciones extra de Google News (además de GNEWS_LOCALES) para entidades con mucha
+# cobertura fuera de España
+LOCALES_POR_ENTIDAD = {
+    "Airbus": ["en-GB", "en-US"],
+    "Galp": ["pt-PT"],
+    "EDP": ["pt-PT"],
+}
+
+# =========================
+# 3) PALABRAS CLAVE
+# =========================
+KEYWORDS_EXACTAS = [
+    # Cargos clave (movimiento de poder)
+    "CEO",
+    "CIO",
+    "CTO",
+
+    # Tecnología core estratégica
+    "ERP",
+    "SAP",
+    "RPA",
+    "IPO",
+    "OPA"
+]
+
+KEYWORDS_POR_CATEGORIA = {
+    # --- Inversión / Oportunidad ---
+    "inversion": [
+        "inversión",
+        "invertirá",
+        "invertirá en",
+        "destina",
+        "destinará",
+        "licita",
+        "licitación",
+        "adjudica",
+        "adjudicación",
+        "adjudicatario",
+        "contrato",
+        "renovación de contrato",
+        "extensión de contrato",
+        "acuerdo marco",
+        "acuerdo plurianual",
+        "concurso público",
+        "pliego",
+        "rfp",
+        "rfi",
+        "tender",
+        "solicitud de ofertas",
+        "proceso competitivo",
+        "convocatoria",
+        "plan",
+        "plan estratégico",
+        "plan de transformación",
+        "programa estratégico",
+        "programa de eficiencia",
+        "plan de reducción de costes",
+        "plan de ahorro",
+        "presupuesto",
+        "capex",
+        "opex",
+        "roadmap",
+        "revisión estratégica",
+        "spin-off",
+        "escisión",
+        "carve-out",
+        "integración tras adquisición",
+    ],
+
+    # --- Verbos de acción frecuentes en prensa ---
+    "accion": [
+        "lanza",
+        "lanza plan",
+        "impulsa",
+        "impulsará",
+        "pone en marcha",
+        "activa",
+        "aprueba",
+        "autoriza",
+        "moderniza",
+        "renueva",
+        "renovará",
+        "actualiza",
+        "digitaliza",
+        "digitalización",
+        "transformación digital",
+        "nuevo sistema",
+        "nueva plataforma",
+        "nuevo modelo operativo",
+        "externaliza",
+        "subcontrata",
+        "implementa",
+        "implementará",
+        "implantará",
+        "despliega",
+        "desarrollará",
+    ],
+
+    # --- Tecnología core Accenture ---
+    "tecnologia": [
+        "ChatGPT",
+        "OpenAI",
+        "Gemini",
+        "inteligencia artificial",
+        "ia generativa",
+        "inteligencia generativa",
+        "genai",
+        "machine learning",
+        "big data",
+        "analytics",
+        "analítica avanzada",
+        "data platform",
+        "data governance",
+        "gobierno del dato",
+        "modernización tecnológica",
+        "core bancario",
+        "erp",
+        "sap",
+        "s/4hana",
+        "salesforce",
+        "servicenow",
+        "oracle",
+        "migración",
+        "migración a la nube",
+        "cloud",
+        "cloud híbrido",
+        "nube híbrida",
+        "multi-cloud",
+        "infraestructura cloud",
+        "infraestructura tecnológica",
+        "infraestructura digital",
+        "data center",
+        "centro de datos",
+        "automatización",
+        "automatización inteligente",
+        "automatización de procesos",
+        "rpa",
+        "hyperautomation",
+        "low code",
+        "plataforma digital",
+        "plataforma tecnológica",
+        "software corporativo",
+        "ciberseguridad",
+        "ciberresiliencia",
+        "zero trust",
+        "identidad digital",
+        "blockchain",
+    ],
+
+    # --- Organización / Movimiento ejecutivo ---
+    "movimiento_ejecutivo": [
+        "nuevo ceo",
+        "nuevo cio",
+        "nuevo cto",
+        "nuevo ciso",
+        "nombramiento",
+        "relevo",
+        "cese",
+        "reestructuración",
+        "cambio organizativo",
+        "dirección digital",
+        "dirección de tecnología",
+        "transformación organizativa",
+    ],
+
+    # --- ESG / Regulación ---
+    "esg_regulacion": [
+        "esg",
+        "csrd",
+        "taxonomía europea",
+        "reporting esg",
+        "descarbonización",
+        "huella de carbono",
+        "eficiencia energética",
+        "hidrógeno",
+        "movilidad eléctrica",
+        "regulación",
+        "normativa",
+        "cumplimiento normativo",
+        "compliance",
+        "supervisión",
+        "requerimientos regulatorios",
+        "resiliencia operativa",
+        "dora",
+        "basel iii",
+        "regulatory framework",
+    ],
+
+    # --- Incidentes / Riesgo ---
+    "incidentes": [
+        "fallo tecnológico",
+        "colapso del sistema",
+        "interrupción del servicio",
+        "caída del sistema",
+        "problemas informáticos",
+        "brecha de seguridad",
+        "ataque informático",
+        "ciberataque",
+        "ransomware",
+        "filtración de datos",
+        "data breach",
+        "cyber attack",
+        "ransomware attack",
+        "it outage",
+        "system failure",
+    ],
+
+    # --- Alianzas ---
+    "alianzas": [
+        "alianza estratégica",
+        "joint venture",
+        "colaboración",
+        "partnership",
+        "acuerdo tecnológico",
+        "selecciona a",
+        "elige a",
+        "partners with",
+        "awards contract",
+        "awarded contract",
+    ],
+
+    # --- Modelo operativo ---
+    "modelo_operativo": [
+        "outsourcing",
+        "bpo",
+        "managed services",
+        "centro de excelencia",
+        "coe",
+        "hub tecnológico",
+        "digital factory",
+    ],
+
+    # --- English expansion ---
+    "english": [
+        "investment",
+        "to invest",
+        "launches",
+        "rolls out",
+        "deploys",
+        "implements",
+        "selects",
+        "appoints",
+        "transformation program",
+        "digital transformation",
+        "modernization",
+        "cloud migration",
+        "core system upgrade",
+        "erp implementation",
+        "technology upgrade",
+        "cost reduction plan",
+        "efficiency program",
+        "it overhaul",
+    ],
+
+    # --- Portuguese expansion ---
+    "portugues": [
+        "investimento",
+        "vai investir",
+        "lança",
+        "lançamento",
+        "adjudicação",
+        "parceria",
+        "aquisição",
+        "nomeado",
+        "nomeação",
+        "transformação digital",
+        "modernização",
+        "migração para a cloud",
+        "ciberseguranca",
+        "cibersegurança",
+        "reestruturação",
+        "plano estratégico",
+    ],
+}
+
+# Idiomas a los que se aplica cada categoría de un idioma concreto; el resto de categorías
+# están en castellano y solo se buscan en las ediciones en español
+IDIOMAS_CATEGORIA = {
+    "english": ["es", "en"],
+    "portugues": ["pt"],
+}
+
+KEYWORDS_GENERALES = [kw for kws in KEYWORDS_POR_CATEGORIA.values() for kw in kws]
+
+# Categoría de cada keyword exacta (las generales la toman de KEYWORDS_POR_CATEGORIA)
+CATEGORIA_EXACTAS = {
+    "CEO": "movimiento_ejecutivo",
+    "CIO": "movimiento_ejecutivo",
+    "CTO": "movimiento_ejecutivo",
+    "ERP": "tecnologia",
+    "SAP": "tecnologia",
+    "RPA": "tecnologia",
+    "IPO": "inversion",
+    "OPA": "inversion",
+}
+
+# Peso de cada categoría en la puntuación de relevancia
+PESOS_CATEGORIA = {
+    "inversion": 3.0,
+    "incidentes": 3.0,
+    "movimiento_ejecutivo": 2.5,
+    "alianzas": 2.0,
+    "modelo_operativo": 2.0,
+    "tecnologia": 1.5,
+    "english": 1.5,
+    "portugues": 1.5,
+    "esg_regulacion": 1.0,
+    "accion": 0.5,
+}
+
+
+# =========================
+# 4) PALABRAS PROHIBIDAS
+# =========================
+PALABRAS_PROHIBIDAS = [
+    "fútbol", "futbol", "liga", "champions", "gol", "partido", "alineación",
+    "fichaje", "entrenador", "baloncesto", "tenis", "nadal", "alonso",
+    "sucesos", "accidente", "lotería",
+    # Ediciones en inglés y portugués
+    "football", "premier league", "lottery", "futebol", "lotaria",
+]
+
+# =========================
+# 5) WHITELISTS (SEPARADAS)
+# =========================
+ALLOWED_DOMAINS = {
+    # Generalistas
+    "elpais.com",
+    "elmundo.es",
+    "abc.es",
+    "20minutos.es",
+    "eldiario.es",
+    "elespanol.com",
+    "larazon.es",
+    "lavanguardia.com",
+    "madridiario.es",
+    "levante-emv.com",
+    "diariodesevilla.es",
+    "elcorreo.com",
+    "elnortedecastilla.es",
+    "heraldo.es",
+    "laverdad.es",
+    "diariodemallorca.es",
+    "canarias7.es",
+    "diariodenavarra.es",
+    "diariomontanes.es",
+    "RTVE.es",
+    "ElPlural.com",
+    "Finanzas.com",
+    "eldiariocantabria.es",
+
+    # Económicos / empresa
+    "expansion.com",
+    "cincodias.elpais.com",
+    "cincodias.com",
+    "eleconomista.es",
+    "elconfidencial.com",
+    "capitalmadrid.com",
+
+    # Internacionales
+    "reuters.com",
+    "bloomberg.com",
+    "ft.com",
+    "wsj.com",
+    "theguardian.com",
+    "bbc.co.uk",
+    "bbc.com",
+    "cnbc.com",
+    "economist.com",
+    "computerweekly.com",
+
+    # Portugal
+    "jornaldenegocios.pt",
+    "eco.sapo.pt",
+    "expresso.pt",
+    "publico.pt",
+    "observador.pt",
+    "dinheirovivo.pt",
+    "jornaleconomico.pt",
+}
+
+# Las variantes de mayúsculas, tildes, espacios y puntuación se resuelven en clave_publisher()
+ALLOWED_PUBLISHERS = {
+    "El País",
+    "El Mundo",
+    "ABC",
+    "20minutos",
+    "elDiario.es",
+    "El Español",
+    "La Razón",
+    "La Vanguardia",
+    "Expansión",
+    "Cinco Días",
+    "elEconomista.es", "El Economista",
+    "El Confidencial",
+    "Capital Madrid",
+    "Diario de Sevilla",
+    "Heraldo de Aragón", "Heraldo",
+    "El Norte de Castilla",
+    "El Correo",
+    "La Verdad",
+    "Diario de Mallorca",
+    "Canarias7",
+    "Diario de Navarra",
+    "El Diario Montañés",
+    "El Periódico",
+    "Cadena SER",
+    "COPE",
+    "Faro de Vigo",
+    "Europa Press",
+    "La Voz de Galicia",
+    "RTVE.es",
+    "ElPlural.com",
+    "Finanzas.com",
+    "eldiariocantabria.es",
+    "Infodefensa",
+    # Internacionales
+    "Reuters",
+    "Bloomberg",
+    "Financial Times",
+    "The Wall Street Journal",
+    "The Guardian",
+    "BBC",
+    "CNBC",
+    "The Economist",
+    "Computer Weekly",
+    # Portugal
+    "Jornal de Negócios",
+    "ECO",
+    "Expresso",
+    "Público",
+    "Observador",
+    "Dinheiro Vivo",
+    "Jornal Económico",
+}
+
+BLOCKED_DOMAINS = set()
+
+# Peso por medio en la puntuación (dominio o nombre del medio); el resto pesa 1.0
+PESOS_FUENTE = {
+    "expansion.com": 1.3,
+    "cincodias.elpais.com": 1.3,
+    "cincodias.com": 1.3,
+    "eleconomista.es": 1.2,
+    "elconfidencial.com": 1.2,
+    "reuters.com": 1.3,
+    "bloomberg.com": 1.3,
+    "ft.com": 1.3,
+    "wsj.com": 1.2,
+    "Europa Press": 0.8,
+    "jornaldenegocios.pt": 1.2,
+    "eco.sapo.pt": 1.2,
+}
+
+def debug_log(msg: str) -> None:
+    if DEBUG_SOURCES:
+        print(msg)
+
+class Metricas:
+    """Temporizadores por etapa y por entidad, contadores y exportación JSON / Prometheus."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.inicio = time.time()
+        self.etapas: Dict[str, Dict[str, float]] = {}
+        self.entidades: Dict[str, Dict[str, float]] = {}
+        self.contadores: Dict[str, int] = {}
+
+    def _acumular(self, destino: Dict[str, Dict[str, float]], clave: str, segundos: float) -> None:
+        with self._lock:
+            reg = destino.setdefault(clave, {"segundos": 0.0, "llamadas": 0})
+            reg["segundos"] += segundos
+            reg["llamadas"] += 1
+
+    @contextmanager
+    def cronometro(self, etapa: str, entidad: str = ""):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            self._acumular(self.etapas, etapa, segundos)
+            if entidad:
+                self._acumular(self.entidades, f"{etapa}:{entidad}", segundos)
+
+    def reiniciar(self) -> None:
+        """Empieza una ejecución nueva (modo daemon): las métricas son siempre de la última."""
+        with self._lock:
+            self.inicio = time.time()
+            self.etapas = {}
+            self.entidades = {}
+            self.contadores = {}
+
+    def sumar(self, contador: str, n: int = 1) -> None:
+        with self._lock:
+            self.contadores[contador] = self.contadores.get(contador, 0) + n
+
+    def informe(self) -> Dict[str, Any]:
+        cache = _REDIRECT_CACHE.stats() if _REDIRECT_CACHE is not None else {}
+        lru = _resolve_memo.cache_info()
+        lru_total = lru.hits + lru.misses
+        with self._lock:
+            return {
+                "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+                "duracion_segundos": round(time.time() - self.inicio, 3),
+                "etapas": {k: dict(v) for k, v in self.etapas.items()},
+                "entidades": {k: dict(v) for k, v in self.entidades.items()},
+                "contadores": dict(self.contadores),
+                "resolve_final_url": {
+                    "lru_hits": lru.hits,
+                    "lru_misses": lru.misses,
+                    "lru_hit_rate": (lru.hits / lru_total) if lru_total else 0.0,
+                    "disco": cache,
+                },
+            }
+
+    @staticmethod
+    def _etiqueta(valor: str) -> str:
+        return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+    def prometheus(self) -> str:
+        inf = self.informe()
+        lineas = [
+            "# TYPE noticias_duracion_segundos gauge",
+            f"noticias_duracion_segundos {inf['duracion_segundos']}",
+            "# TYPE noticias_etapa_segundos gauge",
+        ]
+        for etapa, reg in sorted(inf["etapas"].items()):
+            lineas.append(f'noticias_etapa_segundos{{etapa="{self._etiqueta(etapa)}"}} {reg["segundos"]:.6f}')
+        lineas.append("# TYPE noticias_etapa_llamadas gauge")
+        for etapa, reg in sorted(inf["etapas"].items()):
+            lineas.append(f'noticias_etapa_llamadas{{etapa="{self._etiqueta(etapa)}"}} {reg["llamadas"]}')
+        lineas.append("# TYPE noticias_entidad_segundos gauge")
+        for clave, reg in sorted(inf["entidades"].items()):
+            etapa, _, entidad = clave.partition(":")
+            lineas.append(
+                f'noticias_entidad_segundos{{etapa="{self._etiqueta(etapa)}",entidad="{self._etiqueta(entidad)}"}} '
+                f'{reg["segundos"]:.6f}'
+            )
+        lineas.append("# TYPE noticias_contador gauge")
+        for nombre, valor in sorted(inf["contadores"].items()):
+            lineas.append(f'noticias_contador{{nombre="{self._etiqueta(nombre)}"}} {valor}')
+        res = inf["resolve_final_url"]
+        lineas += [
+            "# TYPE noticias_redirect_cache_hit_rate gauge",
+            f'noticias_redirect_cache_hit_rate{{nivel="lru"}} {res["lru_hit_rate"]:.6f}',
+            f'noticias_redirect_cache_hit_rate{{nivel="disco"}} {res["disco"].get("hit_rate", 0.0):.6f}',
+        ]
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, path_json: str = "", path_prom: str = "") -> None:
+        for path, contenido in (
+            (path_json, lambda: json.dumps(self.informe(), ensure_ascii=False, indent=2)),
+            (path_prom, self.prometheus),
+        ):
+            if not path:
+                continue
+            carpeta = os.path.dirname(path)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            # Escritura atómica: el textfile collector de node_exporter no debe leer un fichero a medias
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(contenido())
+            os.replace(tmp, path)
+
+METRICAS = Metricas()
+
+def norm(s: str) -> str:
+    return re.sub(r"\s+", " ", (s or "").strip().lower())
+
+def plegar(s: str) -> str:
+    """Minúsculas y sin acentos, para comparar nombres escritos con o sin tilde."""
+    t = unicodedata.normalize("NFKD", s or "")
+    return "".join(ch for ch in t if not unicodedata.combining(ch)).lower()
+
+@lru_cache(maxsize=4096)
+def clave_publisher(s: str) -> str:
+    """Clave canónica de un medio: "EL PAÍS", "El Pais" y "el país" dan "elpais"."""
+    return "".join(ch for ch in plegar(s) if ch.isalnum())
+
+def dominio_en(dom: str, dominios: set) -> bool:
+    """True si `dom` o alguno de sus dominios padre está en `dominios` (O(nº de etiquetas))."""
+    while dom:
+        if dom in dominios:
+            return True
+        _, _, dom = dom.partition(".")
+    return False
+
+class KeywordMatcher:
+    """Autómata Aho-Corasick con todas las palabras clave y prohibidas.
+
+    Recorre el texto (ya en minúsculas) una sola vez y devuelve todos los temas encontrados
+    y si hay alguna palabra prohibida. KEYWORDS_GENERALES casan como subcadena (igual que
+    `kw in texto`); KEYWORDS_EXACTAS y PALABRAS_PROHIBIDAS exigen límite de palabra (`\\b`).
+    """
+
+    GENERAL = 0
+    EXACTA = 1
+    PROHIBIDA = 2
+
+    def __init__(self, generales: List[str], exactas: List[str], prohibidas: List[str]) -> None:
+        self._patrones: List[Tuple[str, str, int]] = []
+        for kw in generales:
+            self._patrones.append((kw.lower(), kw, self.GENERAL))
+        for kw in exactas:
+            self._patrones.append((kw.lower(), kw, self.EXACTA))
+        for kw in prohibidas:
+            self._patrones.append((kw, kw, self.PROHIBIDA))
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._salida: List[List[int]] = [[]]
+        for idx, (aguja, _, _) in enumerate(self._patrones):
+            if not aguja:
+                continue
+            estado = 0
+            for ch in aguja:
+                siguiente = self._goto[estado].get(ch)
+                if siguiente is None:
+                    siguiente = len(self._goto)
+                    self._goto[estado][ch] = siguiente
+                    self._goto.append({})
+                    self._salida.append([])
+                estado = siguiente
+            self._salida[estado].append(idx)
+
+        # Enlaces de fallo en anchura; cada nodo hereda las salidas de su enlace de fallo
+        self._fallo = [0] * len(self._goto)
+        cola = list(self._goto[0].values())
+        while cola:
+            siguiente_nivel = []
+            for estado in cola:
+                for ch, hijo in self._goto[estado].items():
+                    f = self._fallo[estado]
+                    while f and ch not in self._goto[f]:
+                        f = self._fallo[f]
+                    destino = self._goto[f].get(ch, 0)
+                    self._fallo[hijo] = destino if destino != hijo else 0
+                    self._salida[hijo] = self._salida[hijo] + self._salida[self._fallo[hijo]]
+                    siguiente_nivel.append(hijo)
+            cola = siguiente_nivel
+
+    @staticmethod
+    def _es_palabra(ch: str) -> bool:
+        return ch.isalnum() or ch == "_"
+
+    def _coincidencias(self, texto: str):
+        goto, fallo, salida, patrones = self._goto, self._fallo, self._salida, self._patrones
+        n = len(texto)
+        estado = 0
+        for i, ch in enumerate(texto):
+            while estado and ch not in goto[estado]:
+                estado = fallo[estado]
+            estado = goto[estado].get(ch, 0)
+            for idx in salida[estado]:
+                aguja, kw, clase = patrones[idx]
+                if clase != self.GENERAL:
+                    inicio = i - len(aguja) + 1
+                    if inicio > 0 and self._es_palabra(texto[inicio - 1]):
+                        continue
+                    if i + 1 < n and self._es_palabra(texto[i + 1]):
+                        continue
+                yield idx, kw, clase
+
+    def analizar(self, texto: str) -> Tuple[List[str], bool]:
+        """Devuelve (temas encontrados en el orden de las listas, hay_prohibida)."""
+        encontrados = set()
+        prohibida = False
+        for idx, _, clase in self._coincidencias(texto):
+            if clase == self.PROHIBIDA:
+                prohibida = True
+            else:
+                encontrados.add(idx)
+        return [self._patrones[idx][1] for idx in sorted(encontrados)], prohibida
+
+    def contiene_prohibida(self, texto: str) -> bool:
+        return any(clase == self.PROHIBIDA for _, _, clase in self._coincidencias(texto))
+
+    def estado(self) -> Tuple[list, list, list, list]:
+        """Tablas del autómata ya construido, solo con tipos básicos (para la caché en disco)."""
+        return self._patrones, self._goto, self._salida, self._fallo
+
+    @classmethod
+    def desde_estado(cls, estado: Tuple[list, list, list, list]) -> "KeywordMatcher":
+        matcher = cls.__new__(cls)
+        patrones, matcher._goto, matcher._salida, matcher._fallo = estado
+        # De JSON los patrones vuelven como listas
+        matcher._patrones = [tuple(p) for p in patrones]
+        return matcher
+
+def temas_a_bits(temas: Iterable[str]) -> int:
+    bits = 0
+    for kw in temas:
+        bits |= _BIT_TEMA[kw]
+    return bits
+
+def bits_a_temas(bits: int) -> List[str]:
+    """Temas de la máscara, en el orden de las listas de keywords."""
+    out = []
+    i = 0
+    while bits:
+        if bits & 1:
+            out.append(TABLA_TEMAS[i])
+        bits >>= 1
+        i += 1
+    return out
+
+@lru_cache(maxsize=4096)
+def texto_temas(bits: int) -> str:
+    """"CLOUD, INVERSIÓN, ..." tal y como se muestra en el correo (las combinaciones se repiten)."""
+    return ", ".join(sorted(bits_a_temas(bits), key=str.lower)).upper()
+
+class EntityMatcher:
+    """Atribuye un texto a las entidades cuyo nombre aparece en él (palabra completa, sin tildes)."""
+
+    def __init__(self, entidades: List[str]) -> None:
+        self._por_nombre = {plegar(e): e for e in entidades}
+        self._matcher = KeywordMatcher([], list(self._por_nombre), [])
+
+    def entidades_en(self, texto: str) -> List[str]:
+        encontrados, _ = self._matcher.analizar(plegar(texto))
+        return [self._por_nombre[n] for n in encontrados]
+
+@lru_cache(maxsize=64)
+def entity_matcher(entidades: Tuple[str, ...]) -> EntityMatcher:
+    return EntityMatcher(list(entidades))
+
+# =========================
+# 6) CONFIGURACIÓN EXTERNA Y ARTEFACTOS COMPILADOS
+# =========================
+# Clave del fichero -> tipo; la global que sustituye es la clave en mayúsculas
+_CLAVES_CONFIG = {
+    "clientes": list,
+    "competidores": list,
+    "partners": list,
+    "keywords_exactas": list,
+    "keywords_por_categoria": dict,
+    "idiomas_categoria": dict,
+    "categoria_exactas": dict,
+    "pesos_categoria": dict,
+    "palabras_prohibidas": list,
+    "allowed_domains": list,
+    "allowed_publishers": list,
+    "blocked_domains": list,
+    "pesos_fuente": dict,
+    "locales_por_entidad": dict,
+}
+_CLAVES_LISTAS_CONFIG = ("keywords_por_categoria", "idiomas_categoria", "locales_por_entidad")
+_CONFIG_BASE = {clave: globals()[clave.upper()] for clave in _CLAVES_CONFIG}
+# Súbelo si cambia lo que produce compilar_config(): invalida las cachés en disco
+_VERSION_ARTEFACTOS = 3
+# Artefactos que son conjuntos (en la caché JSON van como listas ordenadas)
+_CONJUNTOS_ARTEFACTOS = ("allowed_domains", "blocked_domains", "allowed_publishers_norm")
+_CLAVES_ARTEFACTOS = frozenset({
+    "keywords_generales", "matchers", "tabla_temas", "categoria_keyword",
+    "allowed_domains", "blocked_domains", "allowed_publishers_norm", "pesos_fuente_norm",
+})
+# Idioma de las keywords en castellano (y de la edición base es-ES)
+IDIOMA_BASE = "es"
+
+def _validar_config(datos: Any, origen: str) -> Dict[str, Any]:
+    if not isinstance(datos, dict):
+        raise ValueError(f"{origen}: se esperaba un objeto con claves {sorted(_CLAVES_CONFIG)}")
+    desconocidas = sorted(set(datos) - set(_CLAVES_CONFIG))
+    if desconocidas:
+        raise ValueError(f"{origen}: claves desconocidas {desconocidas}")
+    for clave, valor in datos.items():
+        tipo = _CLAVES_CONFIG[clave]
+        if not isinstance(valor, tipo):
+            raise ValueError(f"{origen}: '{clave}' debe ser {'una lista' if tipo is list else 'un objeto'}")
+        if tipo is list:
+            valores = valor
+        elif clave in _CLAVES_LISTAS_CONFIG:
+            if not all(isinstance(kws, list) for kws in valor.values()):
+                raise ValueError(f"{origen}: '{clave}' debe asociar cada clave a una lista")
+            valores = [kw for kws in valor.values() for kw in kws]
+        elif clave == "categoria_exactas":
+            valores = list(valor.values())
+        else:
+            if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in valor.values()):
+                raise ValueError(f"{origen}: los valores de '{clave}' deben ser números")
+            valores = []
+        if not all(isinstance(v, str) and v.strip() for v in valores):
+            raise ValueError(f"{origen}: '{clave}' solo admite textos no vacíos")
+    return datos
+
+def leer_config(path: str) -> Dict[str, Any]:
+    """Configuración efectiva: la del código con las claves del fichero encima (si existe)."""
+    config = {k: (sorted(v) if isinstance(v, set) else v) for k, v in _CONFIG_BASE.items()}
+    if not path or not os.path.exists(path):
+        return config
+    with open(path, "rb") as f:
+        contenido = f.read()
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise RuntimeError(f"{path}: hace falta PyYAML para leer configuración YAML (o usa JSON)")
+        datos = yaml.safe_load(contenido) or {}
+    else:
+        datos = json.loads(contenido.decode("utf-8"))
+    config.update(_validar_config(datos, path))
+    return config
+
+def huella_config(config: Dict[str, Any]) -> str:
+    canonica = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{_VERSION_ARTEFACTOS}:{canonica}".encode("utf-8")).hexdigest()[:32]
+
+def compilar_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Todo lo derivado de la configuración, solo con tipos básicos para poder cachearlo."""
+    por_categoria = config["keywords_por_categoria"]
+    idiomas_categoria = config["idiomas_categoria"]
+    generales = [kw for kws in por_categoria.values() for kw in kws]
+    exactas = list(config["keywords_exactas"])
+    categoria = {kw: cat for cat, kws in por_categoria.items() for kw in kws}
+    categoria.update(config["categoria_exactas"])
+    # Un autómata por idioma; las exactas (siglas) y las prohibidas valen para todos
+    matchers = {}
+    for idioma in dict.fromkeys([IDIOMA_BASE] + [i for idiomas in idiomas_categoria.values() for i in idiomas]):
+        kws_idioma = [
+            kw for cat, kws in por_categoria.items()
+            if idioma in idiomas_categoria.get(cat, [IDIOMA_BASE])
+            for kw in kws
+        ]
+        matchers[idioma] = KeywordMatcher(kws_idioma, exactas, config["palabras_prohibidas"]).estado()
+    return {
+        "keywords_generales": generales,
+        "matchers": matchers,
+        "tabla_temas": list(dict.fromkeys(generales + exactas)),
+        "categoria_keyword": categoria,
+        # ✅ MUST CHANGE #1: Normalizar dominios a minúsculas
+        "allowed_domains": {d.strip().lower() for d in config["allowed_domains"]},
+        "blocked_domains": {d.strip().lower() for d in config["blocked_domains"]},
+        "allowed_publishers_norm": {clave_publisher(x) for x in config["allowed_publishers"]},
+        "pesos_fuente_norm": {
+            (k.lower() if "." in k else clave_publisher(k)): v for k, v in config["pesos_fuente"].items()
+        },
+    }
+
+def _leer_artefactos(ruta: str, huella: str) -> Dict[str, Any]:
+    # JSON y no pickle: el directorio viene de actions/cache y no debe poder ejecutar código
+    with open(ruta, "r", encoding="utf-8") as f:
+        datos = json.load(f)
+    artefactos = datos["artefactos"]
+    if datos.get("huella") != huella or set(artefactos) != _CLAVES_ARTEFACTOS:
+        raise ValueError("no corresponde a esta configuración")
+    for clave in _CONJUNTOS_ARTEFACTOS:
+        artefactos[clave] = set(artefactos[clave])
+    return artefactos
+
+def _escribir_artefactos(ruta: str, huella: str, artefactos: Dict[str, Any]) -> None:
+    serializables = dict(artefactos)
+    for clave in _CONJUNTOS_ARTEFACTOS:
+        serializables[clave] = sorted(artefactos[clave])
+    os.makedirs(CONFIG_CACHE_DIR, exist_ok=True)
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"huella": huella, "artefactos": serializables}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, ruta)
+    # Solo interesa la versión vigente (y nada de cachés antiguas en otros formatos)
+    for nombre in os.listdir(CONFIG_CACHE_DIR):
+        if nombre.endswith((".json", ".pickle")) and nombre != os.path.basename(ruta):
+            os.remove(os.path.join(CONFIG_CACHE_DIR, nombre))
+
+def artefactos_config(config: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """(huella, artefactos): de la caché en disco si la huella coincide, si no se compilan."""
+    huella = huella_config(config)
+    ruta = os.path.join(CONFIG_CACHE_DIR, f"{huella}.json") if CONFIG_CACHE_DIR else ""
+    if ruta:
+        try:
+            return huella, _leer_artefactos(ruta, huella)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            debug_log(f"⚠️ Caché de configuración ilegible ({ruta}): {e!r}; se recompila")
+
+    artefactos = compilar_config(config)
+    if ruta:
+        try:
+            _escribir_artefactos(ruta, huella, artefactos)
+        except OSError as e:
+            debug_log(f"⚠️ No se pudo guardar la caché de configuración: {e!r}")
+    return huella, artefactos
+
+def aplicar_config(config: Dict[str, Any], artefactos: Dict[str, Any]) -> None:
+    """Sustituye de una vez las globales del módulo. Llamar solo entre ejecuciones: las máscaras
+    de temas de las noticias ya creadas se refieren a la TABLA_TEMAS anterior."""
+    global KEYWORDS_GENERALES, ALLOWED_DOMAINS, BLOCKED_DOMAINS, ALLOWED_PUBLISHERS_NORM
+    global _KEYWORD_MATCHER, _KEYWORD_MATCHERS, TABLA_TEMAS, _BIT_TEMA, _CATEGORIA_KEYWORD, _PESOS_FUENTE_NORM
+    globals().update({clave.upper(): valor for clave, valor in config.items()})
+    KEYWORDS_GENERALES = artefactos["keywords_generales"]
+    ALLOWED_DOMAINS = artefactos["allowed_domains"]
+    BLOCKED_DOMAINS = artefactos["blocked_domains"]
+    ALLOWED_PUBLISHERS_NORM = artefactos["allowed_publishers_norm"]
+    _KEYWORD_MATCHERS = {idioma: KeywordMatcher.desde_estado(e) for idioma, e in artefactos["matchers"].items()}
+    _KEYWORD_MATCHER = _KEYWORD_MATCHERS[IDIOMA_BASE]
+    # Tabla de temas: cada noticia guarda sus temas como máscara de bits sobre esta tupla
+    TABLA_TEMAS = tuple(sys.intern(kw) for kw in artefactos["tabla_temas"])
+    _BIT_TEMA = {kw: 1 << i for i, kw in enumerate(TABLA_TEMAS)}
+    _CATEGORIA_KEYWORD = artefactos["categoria_keyword"]
+    _PESOS_FUENTE_NORM = artefactos["pesos_fuente_norm"]
+    texto_temas.cache_clear()
+    _CONFIG_ACTIVA[:] = [config, artefactos]
+
+# (config, artefactos) aplicados; los procesos del pipeline arrancan con ellos
+_CONFIG_ACTIVA: List[Dict[str, Any]] = []
+
+_CONFIG_FIRMA: Optional[Tuple[int, int]] = None
+_CONFIG_HUELLA = ""
+_CONFIG_LOCK = threading.RLock()
+
+def _firma_fichero(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def recargar_config(forzar: bool = False) -> bool:
+    """Vuelve a cargar CONFIG_PATH si el fichero ha cambiado (mtime/tamaño) desde la última vez.
+
+    Devuelve True si la configuración efectiva ha cambiado. Si el fichero nuevo es inválido
+    lanza la excepción y se mantiene la configuración anterior. La primera llamada siempre carga.
+    """
+    global _CONFIG_FIRMA, _CONFIG_HUELLA
+    with _CONFIG_LOCK:
+        firma = _firma_fichero(CONFIG_PATH) if CONFIG_PATH else None
+        if not forzar and _CONFIG_HUELLA and firma == _CONFIG_FIRMA:
+            return False
+        config = leer_config(CONFIG_PATH)
+        huella, artefactos = artefactos_config(config)
+        _CONFIG_FIRMA = firma
+        if huella == _CONFIG_HUELLA:
+            return False
+        aplicar_config(config, artefactos)
+        _CONFIG_HUELLA = huella
+        return True
+
+def cargar_config() -> None:
+    """Carga la configuración y sus artefactos la primera vez que hacen falta.
+
+    Importar el módulo no lee ni escribe nada en disco: lo hacen los puntos de entrada
+    (pipeline, informe, backfill, daemon, CLI) llamando a esta función.
+    """
+    with _CONFIG_LOCK:
+        if not _CONFIG_HUELLA:
+            recargar_config(forzar=True)
+
+EMAIL_REGEX = re.compile(r"^[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}$", re.IGNORECASE)
+
+_HTTP = requests.Session()
+_HTTP.headers.update({"User-Agent": "Mozilla/5.0"})
+
+def _contar_peticion(r, *args, **kwargs):
+    # Los bytes (http_bytes) se cuentan donde se leen de verdad: aquí el cuerpo aún no se ha
+    # leído y en HEAD o en las descargas cortadas no se lee entero
+    METRICAS.sumar("http_peticiones")
+    return r
+
+def _vigilar_google(r, *args, **kwargs):
+    # Los 429/503 de Google en la resolución de enlaces también frenan las descargas
+    if r.status_code in (429, 503) and _netloc(r.url).endswith("google.com"):
+        _CONTROL.registrar("limitado", reservado=False)
+    return r
+
+_HTTP.hooks["response"].append(_contar_peticion)
+_HTTP.hooks["response"].append(_vigilar_google)
+
+class Corpus:
+    """Corpus JSONL comprimido con las respuestas de GNews y las redirecciones resueltas.
+
+    En modo "record" cada respuesta real se añade al fichero; en modo "replay" se carga
+    entero en memoria y se sirve sin tocar la red (consultas desconocidas -> sin resultados,
+    redirecciones desconocidas -> la URL original, textos desconocidos -> vacíos).
+    """
+
+    def __init__(self, modo: str, path: str) -> None:
+        if modo not in ("", "record", "replay"):
+            raise RuntimeError(f"NOTICIAS_MODO desconocido: '{modo}' (usa record o replay).")
+        self.modo = modo
+        self.path = path
+        self._gnews: Dict[str, List[Dict[str, Any]]] = {}
+        self._redirects: Dict[str, str] = {}
+        self._textos: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._fichero = None
+
+        if modo == "replay":
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for linea in f:
+                    if not linea.strip():
+                        continue
+                    reg = json.loads(linea)
+                    if reg["tipo"] == "gnews":
+                        self._gnews[reg["consulta"]] = reg["resultados"]
+                    elif reg["tipo"] == "redirect":
+                        self._redirects[reg["url"]] = reg["final"]
+                    elif reg["tipo"] == "texto":
+                        self._textos[reg["url"]] = reg["texto"]
+        elif modo == "record":
+            carpeta = os.path.dirname(path)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            self._fichero = gzip.open(path, "at", encoding="utf-8")
+
+    @property
+    def replay(self) -> bool:
+        return self.modo == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.modo == "record"
+
+    def _escribir(self, registro: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._fichero is not None:
+                self._fichero.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+
+    def grabar_gnews(self, consulta: str, resultados: List[Dict[str, Any]]) -> None:
+        self._escribir({"tipo": "gnews", "consulta": consulta, "resultados": resultados})
+
+    def grabar_redireccion(self, url: str, final: str) -> None:
+        self._escribir({"tipo": "redirect", "url": url, "final": final})
+
+    def grabar_texto(self, url: str, texto: str) -> None:
+        self._escribir({"tipo": "texto", "url": url, "texto": texto})
+
+    def gnews(self, consulta: str) -> List[Dict[str, Any]]:
+        return [dict(a) for a in self._gnews.get(consulta, [])]
+
+    def redireccion(self, url: str) -> str:
+        return self._redirects.get(url, url)
+
+    def texto(self, url: str) -> str:
+        return self._textos.get(url, "")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fichero is not None:
+                self._fichero.close()
+                self._fichero = None
+
+_CORPUS: Optional[Corpus] = None
+_CORPUS_LOCK = threading.Lock()
+
+def corpus_activo() -> Corpus:
+    global _CORPUS
+    with _CORPUS_LOCK:
+        if _CORPUS is None:
+            _CORPUS = Corpus(NOTICIAS_MODO, NOTICIAS_CORPUS)
+        return _CORPUS
+
+def _netloc(url: str) -> str:
+    try:
+        netloc = urlparse(url).netloc.lower()
+        if netloc.startswith("www."):
+            netloc = netloc[4:]
+        return netloc
+    except Exception:
+        return ""
+
+def _looks_like_google_redirect(url: str) -> bool:
+    host = _netloc(url)
+    return any(x in host for x in ("news.google.com", "news.googleusercontent.com", "google.com"))
+
+class RedirectCache:
+    """Caché SQLite url de Google -> url final, con TTL, tamaño máximo y contadores hit/miss.
+
+    El fichero sobrevive entre ejecuciones (en GitHub Actions se guarda con actions/cache).
+    Con `path` vacío la caché queda desactivada y siempre falla.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            carpeta = os.path.dirname(path)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS redirects (url TEXT PRIMARY KEY, final TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS redirects_ts ON redirects (ts)")
+            self._conn.commit()
+
+    def get(self, url: str) -> Optional[str]:
+        with self._lock:
+            if self._conn is None:
+                self.misses += 1
+                return None
+            fila = self._conn.execute("SELECT final, ts FROM redirects WHERE url = ?", (url,)).fetchone()
+            if fila is None or time.time() - fila[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return fila[0]
+
+    def put(self, url: str, final: str) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO redirects (url, final, ts) VALUES (?, ?, ?)",
+                (url, final, time.time()),
+            )
+            # Sin transacciones abiertas entre puts: en el daemon la conexión vive días y
+            # otro proceso (un backfill) tiene que poder escribir en el mismo fichero
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """Borra entradas caducadas y, si sobra tamaño, las más antiguas. Devuelve cuántas borró."""
+        with self._lock:
+            if self._conn is None:
+                return 0
+            antes = self._conn.total_changes
+            self._conn.execute("DELETE FROM redirects WHERE ts < ?", (time.time() - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM redirects WHERE url IN ("
+                "SELECT url FROM redirects ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            return self._conn.total_changes - antes
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        self.evict()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+_REDIRECT_CACHE: Optional[RedirectCache] = None
+_REDIRECT_CACHE_LOCK = threading.Lock()
+
+def redirect_cache() -> RedirectCache:
+    global _REDIRECT_CACHE
+    with _REDIRECT_CACHE_LOCK:
+        if _REDIRECT_CACHE is None:
+            _REDIRECT_CACHE = RedirectCache(
+                REDIRECT_CACHE_PATH, REDIRECT_CACHE_TTL_DAYS * 86400, REDIRECT_CACHE_MAX
+            )
+        return _REDIRECT_CACHE
+
+_GOOGLE_ARTICLE_RE = re.compile(r"/(?:rss/)?articles/([A-Za-z0-9_-]+)")
+_GOOGLE_ARTICLE_PREFIX = b"\x08\x13\x22"
+_MAX_REDIRECT_HOPS = 6
+
+def decode_google_news_url(url: str) -> Optional[str]:
+    """Decodifica en local el enlace del medio a partir del id de news.google.com/rss/articles/...
+
+    El id es un protobuf en base64url: prefijo 08 13 22, longitud varint y la URL original.
+    Los ids del formato nuevo ("AU_yqL...") no llevan la URL dentro: se devuelve None.
+    """
+    parsed = urlparse(url)
+    if not parsed.netloc.lower().endswith("news.google.com"):
+        return None
+    m = _GOOGLE_ARTICLE_RE.search(parsed.path)
+    if not m:
+        return None
+
+    article_id = m.group(1)
+    try:
+        raw = base64.urlsafe_b64decode(article_id + "=" * (-len(article_id) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if not raw.startswith(_GOOGLE_ARTICLE_PREFIX):
+        return None
+    raw = raw[len(_GOOGLE_ARTICLE_PREFIX):]
+
+    longitud, shift, pos = 0, 0, 0
+    while pos < len(raw):
+        byte = raw[pos]
+        pos += 1
+        longitud |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+
+    candidato = raw[pos:pos + longitud]
+    if len(candidato) != longitud:
+        return None
+    try:
+        decoded = candidato.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    if not decoded.startswith(("http://", "https://")):
+        return None
+    return decoded
+
+def _resolve_by_hops(url: str) -> str:
+    """Sigue la cadena de redirecciones salto a salto sin descargar cuerpos.
+
+    Usa HEAD y, si el servidor no lo acepta, GET en streaming que se cierra sin leer.
+    Se detiene en el primer salto que ya no es de Google.
+    """
+    actual = url
+    for _ in range(_MAX_REDIRECT_HOPS):
+        if not _looks_like_google_redirect(actual):
+            return actual
+        r = _HTTP.head(actual, allow_redirects=False, timeout=10)
+        if r.status_code >= 400:
+            r.close()
+            r = _HTTP.get(actual, allow_redirects=False, timeout=10, stream=True)
+        try:
+            status = r.status_code
+            location = r.headers.get("Location")
+        finally:
+            r.close()
+        if not (300 <= status < 400) or not location:
+            return actual
+        actual = urljoin(actual, location)
+    return actual
+
+class _SinResolver(Exception):
+    """La URL de Google no se ha podido resolver ahora (circuito abierto, timeout, error)."""
+
+def resolve_final_url(url: str) -> str:
+    if not _looks_like_google_redirect(url):
+        return url
+    try:
+        return _resolve_memo(url)
+    except _SinResolver:
+        return url
+
+@lru_cache(maxsize=5000)
+def _resolve_memo(url: str) -> str:
+    # Solo se memorizan resoluciones: lru_cache no guarda excepciones, así que un fallo
+    # transitorio se reintenta la próxima vez en vez de durar todo el proceso (en el daemon, días)
+    corpus = corpus_activo()
+    if corpus.replay:
+        final_url = corpus.redireccion(url)
+    else:
+        with METRICAS.cronometro("resolve_url"):
+            final_url = _resolve_final_url(url)
+        if corpus.recording:
+            corpus.grabar_redireccion(url, final_url)
+    if final_url == url:
+        raise _SinResolver(url)
+    return final_url
+
+def _resolve_final_url(url: str) -> str:
+    # 1) Decodificación local del id del artículo: sin red
+    decoded = decode_google_news_url(url)
+    if decoded:
+        return decoded
+
+    cache = redirect_cache()
+    try:
+        cached = cache.get(url)
+    except sqlite3.Error as e:
+        # Una caché bloqueada (p. ej. por otro proceso) es un fallo de caché, no del artículo
+        METRICAS.sumar("cache_errores")
+        debug_log(f"    ⚠️ Caché de redirecciones: {e}")
+        cached = None
+    if cached:
+        return cached
+
+    # 2) Saltos HEAD / GET sin cuerpo hasta salir de Google (no con el circuito abierto)
+    if _CONTROL.abierto():
+        METRICAS.sumar("resolve_circuito_abierto")
+        return url
+    try:
+        final_url = _resolve_by_hops(url) or url
+    except requests.Timeout:
+        _CONTROL.registrar("timeout", reservado=False)
+        return url
+    except Exception:
+        return url
+
+    # Solo se persisten resoluciones reales, nunca los fallos
+    if final_url != url:
+        try:
+            cache.put(url, final_url)
+        except sqlite3.Error as e:
+            METRICAS.sumar("cache_errores")
+            debug_log(f"    ⚠️ Caché de redirecciones: {e}")
+    return final_url
+
+def allowed_source(articulo: Dict[str, Any]) -> Tuple[bool, str, str, str]:
+    url = (articulo.get("url") or articulo.get("link") or "").strip()
+    publisher_raw = ((articulo.get("publisher") or {}).get("title") or "").strip()
+    return comprobar_fuente(url, publisher_raw)
+
+def comprobar_fuente(url: str, publisher_raw: str) -> Tuple[bool, str, str, str]:
+    """(permitida, dominio, url final, medio) de un enlace de GNews y el nombre de su medio."""
+
+    final_url = resolve_final_url(url)
+    dom = _netloc(final_url)
+
+    if dom and dominio_en(dom, BLOCKED_DOMAINS):
+        return False, dom, final_url, publisher_raw
+
+    if dom == "news.google.com":
+        pub_ok = clave_publisher(publisher_raw) in ALLOWED_PUBLISHERS_NORM
+        return pub_ok, dom, final_url, publisher_raw
+
+    dom_ok = dominio_en(dom, ALLOWED_DOMAINS)
+    return dom_ok, dom, final_url, publisher_raw
+
+class _ExtractorTexto(HTMLParser):
+    """Texto principal de una página: sus párrafos (<p>) fuera de scripts, menús, cabeceras y
+    pies. Si la página tiene <article>, solo los párrafos de dentro."""
+
+    _IGNORAR = {"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form"}
+    _MIN_CHARS = 40  # los párrafos más cortos suelen ser pies de foto, firmas o botones
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self._ignorar = 0
+        self._en_article = 0
+        self._parrafo: Optional[List[str]] = None
+        self._parrafo_en_article = False
+        self.parrafos: List[str] = []
+        self.parrafos_article: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in self._IGNORAR:
+            self._ignorar += 1
+        elif tag == "article":
+            self._en_article += 1
+        elif tag == "p":
+            self._cerrar_parrafo()
+            self._parrafo = []
+            self._parrafo_en_article = self._en_article > 0
+        elif tag == "br" and self._parrafo is not None:
+            self._parrafo.append(" ")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self._IGNORAR:
+            self._ignorar = max(0, self._ignorar - 1)
+        elif tag == "article":
+            self._cerrar_parrafo()
+            self._en_article = max(0, self._en_article - 1)
+        elif tag == "p":
+            self._cerrar_parrafo()
+
+    def handle_data(self, data: str) -> None:
+        if self._parrafo is not None and not self._ignorar:
+            self._parrafo.append(data)
+
+    def _cerrar_parrafo(self) -> None:
+        if self._parrafo is None:
+            return
+        texto = " ".join("".join(self._parrafo).split())
+        self._parrafo = None
+        if len(texto) >= self._MIN_CHARS:
+            self.parrafos.append(texto)
+            if self._parrafo_en_article:
+                self.parrafos_article.append(texto)
+
+    def texto(self) -> str:
+        self._cerrar_parrafo()
+        return "\n".join(self.parrafos_article or self.parrafos)
+
+def extraer_texto(html: str, max_chars: int = ENRICH_MAX_CHARS) -> str:
+    extractor = _ExtractorTexto()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        pass  # HTML roto: vale lo extraído hasta ahí
+    return extractor.texto()[:max_chars]
+
+class TextoCache:
+    """Caché SQLite url final -> texto extraído (comprimido), con TTL y tamaño máximo.
+
+    Guarda también los textos vacíos (páginas sin párrafos, 404, no HTML) para no volver a
+    descargarlas; los fallos transitorios no se guardan. Con `path` vacío queda desactivada.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            carpeta = os.path.dirname(path)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS textos (url TEXT PRIMARY KEY, texto BLOB NOT NULL, ts REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS textos_ts ON textos (ts)")
+            self._conn.commit()
+
+    def get(self, url: str) -> Optional[str]:
+        with self._lock:
+            if self._conn is None:
+                self.misses += 1
+                return None
+            fila = self._conn.execute("SELECT texto, ts FROM textos WHERE url = ?", (url,)).fetchone()
+            if fila is None or time.time() - fila[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return zlib.decompress(fila[0]).decode("utf-8")
+
+    def put(self, url: str, texto: str) -> None:
+        comprimido = zlib.compress(texto.encode("utf-8"))
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO textos (url, texto, ts) VALUES (?, ?, ?)",
+                (url, comprimido, time.time()),
+            )
+            self._conn.commit()
+
+    def evict(self) -> int:
+        with self._lock:
+            if self._conn is None:
+                return 0
+            antes = self._conn.total_changes
+            self._conn.execute("DELETE FROM textos WHERE ts < ?", (time.time() - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM textos WHERE url IN ("
+                "SELECT url FROM textos ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            return self._conn.total_changes - antes
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        self.evict()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+_TEXTO_CACHE: Optional[TextoCache] = None
+_TEXTO_CACHE_LOCK = threading.Lock()
+
+def texto_cache() -> TextoCache:
+    global _TEXTO_CACHE
+    with _TEXTO_CACHE_LOCK:
+        if _TEXTO_CACHE is None:
+            _TEXTO_CACHE = TextoCache(ENRICH_CACHE_PATH, ENRICH_CACHE_TTL_DAYS * 86400, ENRICH_CACHE_MAX)
+        return _TEXTO_CACHE
+
+_CHARSET_RE = re.compile(r"""charset=["']?([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+
+def _descargar_texto(url: str) -> Optional[str]:
+    """Descarga en streaming (como mucho ENRICH_MAX_BYTES y ENRICH_TIMEOUT_S en total) y
+    extrae el texto. None si el fallo es transitorio (red, 429, 5xx): no se cachea."""
+    limite = time.monotonic() + ENRICH_TIMEOUT_S
+    try:
+        r = _HTTP.get(url, timeout=ENRICH_TIMEOUT_S, stream=True)
+    except requests.RequestException:
+        return None
+    trozos: List[bytes] = []
+    try:
+        if r.status_code == 429 or r.status_code >= 500:
+            return None
+        tipo = r.headers.get("Content-Type", "")
+        if r.status_code >= 400 or "html" not in tipo.lower():
+            return ""
+        # read1 vuelve tras cada lectura del socket (urllib3 2): un servidor que envía el
+        # cuerpo gota a gota no puede alargar la descarga más allá del límite
+        leer = getattr(r.raw, "read1", r.raw.read)
+        total = 0
+        while True:
+            trozo = leer(16384, decode_content=True)
+            if not trozo:
+                break
+            trozos.append(trozo)
+            total += len(trozo)
+            METRICAS.sumar("http_bytes", len(trozo))
+            if total >= ENRICH_MAX_BYTES or time.monotonic() > limite:
+                METRICAS.sumar("enrich_truncadas")
+                break
+    except Exception:
+        # Error de red a mitad: si ya hay algo, se aprovecha; si no, se reintentará otro día
+        if not trozos:
+            return None
+    finally:
+        r.close()
+    crudo = b"".join(trozos)[:ENRICH_MAX_BYTES]
+    METRICAS.sumar("enrich_bytes", len(crudo))
+
+    # requests supone ISO-8859-1 si la cabecera no trae charset: se mira también el <meta>
+    m = _CHARSET_RE.search(tipo) or _CHARSET_RE.search(crudo[:4096].decode("ascii", "ignore"))
+    try:
+        html = crudo.decode(m.group(1) if m else "utf-8", errors="replace")
+    except LookupError:
+        html = crudo.decode("utf-8", errors="replace")
+    return extraer_texto(html)
+
+def texto_articulo(url: str, descargar: bool = True) -> str:
+    """Texto del artículo en `url` (URL final de un medio permitido); "" si no se pudo obtener.
+
+    Con `descargar=False` (presupuesto de tiempo agotado) solo se usa la caché.
+    """
+    corpus = corpus_activo()
+    if corpus.replay:
+        return corpus.texto(url)
+    cache = texto_cache()
+    try:
+        texto = cache.get(url)
+    except sqlite3.Error as e:
+        METRICAS.sumar("cache_errores")
+        debug_log(f"    ⚠️ Caché de textos: {e}")
+        texto = None
+    if texto is not None:
+        return texto
+    if not descargar:
+        METRICAS.sumar("enrich_fuera_de_plazo")
+        return ""
+    with METRICAS.cronometro("enrich_descarga"):
+        texto = _descargar_texto(url)
+    if texto is None:
+        METRICAS.sumar("enrich_errores")
+        return ""
+    try:
+        cache.put(url, texto)
+    except sqlite3.Error as e:
+        METRICAS.sumar("cache_errores")
+        debug_log(f"    ⚠️ Caché de textos: {e}")
+    if corpus.recording:
+        corpus.grabar_texto(url, texto)
+    return texto
+
+class TokenBucket:
+    """Limitador token-bucket thread-safe: `rate` peticiones/seg con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = max(rate, 0.01)
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                espera = (1.0 - self._tokens) / self.rate
+            # Pequeño jitter para no sincronizar a todos los hilos sobre Google News
+            time.sleep(espera + random.uniform(0.0, 0.1))
+
+    def ajustar(self, rate: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.rate = max(rate, 0.01)
+
+_RATE_LIMITER = TokenBucket(FETCH_RPS, FETCH_BURST)
+
+class GNewsLimitado(Exception):
+    """Google ha respondido 429/503 o no ha respondido a tiempo: la consulta se reintenta después."""
+
+class CircuitoAbierto(GNewsLimitado):
+    """El cortacircuitos está abierto: la petición ni siquiera se envía."""
+
+class ControlAdaptativo:
+    """AIMD sobre el ritmo (peticiones/seg) y la concurrencia contra Google, con cortacircuitos.
+
+    Cada respuesta correcta y rápida sube el ritmo en `paso_rps` y la concurrencia en
+    1/concurrencia (aumento aditivo); cada 429/503, timeout o respuesta lenta los divide a
+    la mitad (disminución multiplicativa). Con `umbral` fallos seguidos (429/503 o timeout)
+    el circuito se abre `enfriamiento` segundos, el doble en cada apertura consecutiva;
+    pasado ese tiempo deja salir una única petición de prueba que lo cierra o lo reabre.
+    """
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        rps_max: float,
+        rps_min: float,
+        paso_rps: float,
+        concurrencia_max: int,
+        umbral: int,
+        enfriamiento: float,
+        latencia_lenta: float,
+    ) -> None:
+        self.limiter = limiter
+        self.rps_max = max(rps_max, 0.01)
+        self.rps_min = min(max(rps_min, 0.01), self.rps_max)
+        self.paso_rps = paso_rps
+        self.concurrencia_max = max(1, concurrencia_max)
+        self.umbral = max(1, umbral)
+        self.enfriamiento = enfriamiento
+        self.latencia_lenta = latencia_lenta
+        self.rps = self.rps_max
+        self.concurrencia = float(self.concurrencia_max)
+        self._en_vuelo = 0
+        self._fallos_seguidos = 0
+        self._aperturas = 0
+        self._abierto_hasta = 0.0
+        self._sonda = False
+        self._cond = threading.Condition()
+
+    def abierto(self) -> bool:
+        with self._cond:
+            return self._sonda or time.monotonic() < self._abierto_hasta
+
+    def adquirir(self, hasta: Optional[float] = None) -> None:
+        """Reserva un hueco de concurrencia y un token del limitador.
+
+        Con el circuito abierto lanza CircuitoAbierto; con `hasta` (instante de
+        time.monotonic) espera a que se cierre, salvo que no vaya a cerrarse antes.
+        Cada adquirir() exitoso debe ir seguido de un registrar().
+        """
+        with self._cond:
+            while True:
+                ahora = time.monotonic()
+                if ahora < self._abierto_hasta or self._sonda:
+                    reabre = self._abierto_hasta if ahora < self._abierto_hasta else ahora + 1.0
+                    if hasta is None or reabre > hasta:
+                        raise CircuitoAbierto(f"circuito abierto {max(0.0, self._abierto_hasta - ahora):.0f}s más")
+                    self._cond.wait(reabre - ahora)
+                    continue
+                if self._en_vuelo >= int(self.concurrencia):
+                    self._cond.wait(1.0)
+                    continue
+                # Semiabierto: tras el enfriamiento solo sale esta petición de prueba
+                self._sonda = self._fallos_seguidos >= self.umbral
+                self._en_vuelo += 1
+                break
+        self.limiter.acquire()
+
+    def registrar(self, resultado: str, latencia: float = 0.0, reservado: bool = True) -> None:
+        """Resultado de una petición: "ok", "limitado" (429/503), "timeout" o "error" (neutro).
+
+        Con `reservado=False` es una señal de otra petición a Google que no pasó por adquirir().
+        """
+        if resultado == "ok" and latencia >= self.latencia_lenta:
+            resultado = "lento"
+        METRICAS.sumar(f"control.{resultado}")
+        with self._cond:
+            if reservado:
+                self._en_vuelo -= 1
+                sonda, self._sonda = self._sonda, False
+            else:
+                sonda = False
+
+            if resultado == "ok":
+                self._fallos_seguidos = 0
+                if sonda:
+                    self._aperturas = 0
+                self.rps = min(self.rps_max, self.rps + self.paso_rps)
+                self.concurrencia = min(float(self.concurrencia_max), self.concurrencia + 1.0 / self.concurrencia)
+            elif resultado in ("lento", "limitado", "timeout"):
+                self.rps = max(self.rps_min, self.rps / 2)
+                self.concurrencia = max(1.0, self.concurrencia / 2)
+                if resultado != "lento":
+                    self._fallos_seguidos += 1
+                    if self._fallos_seguidos >= self.umbral and (sonda or time.monotonic() >= self._abierto_hasta):
+                        self._abrir()
+            self.limiter.ajustar(self.rps)
+            self._cond.notify_all()
+
+    def _abrir(self) -> None:
+        self._aperturas += 1
+        duracion = self.enfriamiento * (2 ** min(self._aperturas - 1, 3))
+        self._abierto_hasta = time.monotonic() + duracion
+        METRICAS.sumar("circuito_aperturas")
+        print(f"🔌 Google limita las peticiones: circuito abierto {duracion:.0f}s (ritmo {self.rps:.2f}/s)")
+
+    def estado(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "rps": round(self.rps, 3),
+                "concurrencia": round(self.concurrencia, 2),
+                "aperturas": self._aperturas,
+                "abierto": time.monotonic() < self._abierto_hasta,
+            }
+
+_CONTROL = ControlAdaptativo(
+    _RATE_LIMITER, FETCH_RPS, ADAPT_RPS_MIN, ADAPT_PASO_RPS, FETCH_WORKERS,
+    CIRCUIT_FALLOS, CIRCUIT_ENFRIAMIENTO_S, ADAPT_LATENCIA_LENTA_S,
+)
+_FETCH_POOL: Optional[ThreadPoolExecutor] = None
+_FETCH_POOL_LOCK = threading.Lock()
+
+def _fetch_pool() -> ThreadPoolExecutor:
+    global _FETCH_POOL
+    with _FETCH_POOL_LOCK:
+        if _FETCH_POOL is None:
+            _FETCH_POOL = ThreadPoolExecutor(max_workers=max(1, FETCH_WORKERS), thread_name_prefix="gnews")
+        return _FETCH_POOL
+
+def consulta_gnews(lote: List[str]) -> str:
+    if len(lote) == 1:
+        return lote[0]
+    return " OR ".join(f'"{entidad}"' for entidad in lote)
+
+# Códigos de idioma de GNews que no coinciden con el prefijo del locale
+_IDIOMA_GNEWS = {"pt-PT": "pt-150", "pt-BR": "pt-419"}
+
+def idioma_locale(locale: str) -> str:
+    return locale.partition("-")[0].lower()
+
+def _gnews_locale(locale: str) -> Tuple[str, str]:
+    """"en-GB" -> ("en", "GB"): idioma y país tal y como los espera GNews."""
+    idioma, _, pais = locale.partition("-")
+    return _IDIOMA_GNEWS.get(locale, idioma.lower()), pais.upper()
+
+def lotes_por_locale(entidades: List[str]) -> List[Tuple[str, List[str]]]:
+    """(locale, lote) de todas las ediciones: las de GNEWS_LOCALES con todas las entidades y las
+    de LOCALES_POR_ENTIDAD solo con las suyas. Primero la edición base, que gana en la dedup."""
+    por_locale: Dict[str, List[str]] = {locale: list(entidades) for locale in GNEWS_LOCALES}
+    for entidad in entidades:
+        for locale in LOCALES_POR_ENTIDAD.get(entidad, []):
+            miembros = por_locale.setdefault(locale, [])
+            if entidad not in miembros:
+                miembros.append(entidad)
+    return [(locale, lote) for locale, miembros in por_locale.items() for lote in agrupar_entidades(miembros)]
+
+def agrupar_entidades(
+    entidades: List[str],
+    max_entidades: int = GNEWS_BATCH_ENTIDADES,
+    max_chars: int = GNEWS_BATCH_MAX_CHARS,
+) -> List[List[str]]:
+    """Agrupa entidades en lotes para consultas OR, respetando el nº de entidades y la longitud."""
+    lotes: List[List[str]] = []
+    actual: List[str] = []
+    for entidad in entidades:
+        candidato = actual + [entidad]
+        if actual and (len(candidato) > max_entidades or len(consulta_gnews(candidato)) > max_chars):
+            lotes.append(actual)
+            candidato = [entidad]
+        actual = candidato
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+# GNews se traga los errores (un 429 o un timeout devuelven []): se anota en cada hilo
+# el código HTTP y la excepción de red que feedparser deja en su resultado. feedparser
+# descarga con urllib, fuera de _HTTP: sus peticiones y bytes leídos se cuentan aquí.
+_ESTADO_FEED = threading.local()
+
+def _instrumentar_feedparser() -> None:
+    if feedparser is None or getattr(feedparser.parse, "instrumentado", False):
+        return
+    original = feedparser.parse
+
+    def parse(*args, **kwargs):
+        datos = original(*args, **kwargs)
+        _ESTADO_FEED.status = datos.get("status")
+        _ESTADO_FEED.error = datos.get("bozo_exception")
+        return datos
+
+    parse.instrumentado = True
+    feedparser.parse = parse
+
+    http = getattr(feedparser, "http", None)  # feedparser >= 6
+    if http is None or not hasattr(http, "get"):
+        return
+    original_get = http.get
+
+    def get(*args, **kwargs):
+        METRICAS.sumar("http_peticiones")
+        datos = original_get(*args, **kwargs)
+        METRICAS.sumar("http_bytes", len(datos or b""))
+        return datos
+
+    http.get = get
+
+_instrumentar_feedparser()
+
+def _estado_feed() -> Tuple[str, str]:
+    status = getattr(_ESTADO_FEED, "status", None)
+    error = getattr(_ESTADO_FEED, "error", None)
+    if status in (429, 503):
+        return "limitado", f"HTTP {status}"
+    if isinstance(error, OSError):
+        return "timeout", str(error)
+    return "ok", ""
+
+def descargar_noticias(
+    consulta: str,
+    hasta: Optional[float] = None,
+    dia: Optional[date] = None,
+    locale: str = "es-ES",
+) -> List[Dict[str, Any]]:
+    """Noticias de las últimas 24 h o, con `dia`, las publicadas ese día (backfill), en la
+    edición `locale` de Google News."""
+    # Los corpus grabados antes de las ediciones extra no llevan sufijo para es-ES
+    clave = consulta if locale == "es-ES" else f"{consulta}#{locale}"
+    if dia is not None:
+        clave = f"{clave}@{dia.isoformat()}"
+    corpus = corpus_activo()
+    if corpus.replay:
+        return corpus.gnews(clave)
+
+    with METRICAS.cronometro("espera_rate_limit"):
+        _CONTROL.adquirir(hasta)
+    resultado, detalle = "error", ""
+    inicio = time.monotonic()
+    idioma, pais = _gnews_locale(locale)
+    try:
+        if dia is None:
+            google_news = GNews(language=idioma, country=pais, period="1d", max_results=100)
+        else:
+            siguiente = dia + timedelta(days=1)
+            google_news = GNews(
+                language=idioma, country=pais, max_results=100,
+                start_date=(dia.year, dia.month, dia.day),
+                end_date=(siguiente.year, siguiente.month, siguiente.day),
+            )
+        _ESTADO_FEED.__dict__.clear()
+        with METRICAS.cronometro("gnews_fetch", consulta):
+            resultados = google_news.get_news(consulta) or []
+        resultado, detalle = _estado_feed()
+    except OSError as e:
+        resultado, detalle = "timeout", str(e)
+    finally:
+        _CONTROL.registrar(resultado, time.monotonic() - inicio)
+    if resultado in ("limitado", "timeout"):
+        # Sin resultados por culpa de Google, no porque no haya noticias: no se graba
+        raise GNewsLimitado(f"Google News {resultado}: {detalle}")
+    METRICAS.sumar("gnews_resultados", len(resultados))
+    METRICAS.sumar(f"gnews_resultados.{locale}", len(resultados))
+    if corpus.recording:
+        corpus.grabar_gnews(clave, resultados)
+    return resultados
+
+def parse_recipients(raw: str) -> List[str]:
+    if not raw:
+        return []
+    parts = re.split(r"[;,]", raw)
+    emails = []
+    for p in parts:
+        e = p.strip()
+        if e and EMAIL_REGEX.match(e):
+            emails.append(e)
+    seen = set()
+    out = []
+    for e in emails:
+        if e not in seen:
+            out.append(e)
+            seen.add(e)
+    return out
+
+def validate_env(recipients: List[str]) -> None:
+    if not EMAIL_USER:
+        raise RuntimeError("Falta la variable de entorno EMAIL_USER.")
+    if SMTP_AUTH and not EMAIL_PASS:
+        raise RuntimeError("Falta la variable de entorno EMAIL_PASS.")
+    if not recipients:
+        raise RuntimeError("Falta EMAIL_TO (o EMAIL_TO_<TIPO>) o no hay destinatarios válidos (separa por comas o ;).")
+
+def contiene_palabra_prohibida(texto: str) -> bool:
+    return _KEYWORD_MATCHER.contiene_prohibida(texto)
+
+def es_similar(a: str, b: str) -> bool:
+    # real_quick_ratio/quick_ratio son cotas superiores baratas de ratio(): mismo resultado
+    sm = SequenceMatcher(None, a, b)
+    return sm.real_quick_ratio() > 0.65 and sm.quick_ratio() > 0.65 and sm.ratio() > 0.65
+
+@lru_cache(maxsize=8)
+def _sondas_densificacion(k: int, seed: int, sondas: int = 64) -> Tuple[Tuple[int, ...], ...]:
+    """Para cada caja de la firma, una secuencia fija de cajas al azar (igual para todo titular)."""
+    rnd = random.Random(seed)
+    return tuple(tuple(rnd.randrange(k) for _ in range(sondas)) for _ in range(k))
+
+class DetectorDuplicados:
+    """Detector de casi-duplicados de titulares con MinHash + LSH sobre 4-gramas de caracteres.
+
+    Cada titular aceptado se indexa en `bandas` cubetas. Un titular nuevo solo se compara
+    (con `es_similar`, el mismo criterio de 0.65) contra los que comparten alguna cubeta y,
+    de esos, solo contra los `max_verificaciones` más parecidos según la firma con un Jaccard
+    estimado de al menos `umbral`: el número de SequenceMatcher por artículo está acotado y
+    no crece con el número de titulares vistos (p. ej. los muchos de una misma entidad).
+
+    La firma usa "one permutation hashing": un único hash por 4-grama repartido en
+    bandas*filas cajas. Las cajas vacías se rellenan con la "densificación óptima" (cada una
+    copia la primera caja llena de su propia secuencia de sondas al azar), así las bandas son
+    independientes; rellenarlas con la caja vecina las correlaciona y dispara los candidatos.
+    Los pares con ratio > 0.65 tienen un Jaccard de 4-gramas de ~0.3 o más; los titulares sin
+    relación, aunque compartan entidad, rara vez pasan de 0.2. Con 50 bandas de 4 filas
+    (umbral del LSH ~0.38) ~99% de esos pares comparten cubeta y los candidatos por titular
+    crecen muy por debajo del número de titulares indexados.
+    """
+
+    _MASCARA = 0xFFFFFFFF
+
+    def __init__(
+        self,
+        bandas: int = 50,
+        filas: int = 4,
+        ngram: int = 4,
+        seed: int = 1,
+        umbral: float = 0.25,
+        max_verificaciones: int = 4,
+    ) -> None:
+        self.bandas = bandas
+        self.filas = filas
+        self.ngram = ngram
+        self.seed = seed
+        self.umbral = umbral
+        self.max_verificaciones = max_verificaciones
+        self._sondas = _sondas_densificacion(bandas * filas, seed)
+        # Por banda, hash de la banda -> índice, o lista de índices si hay más de uno
+        # (casi todas las cubetas tienen un solo titular: sin lista, el índice ocupa un tercio)
+        self._cubetas: List[Dict[int, Union[int, List[int]]]] = [{} for _ in range(bandas)]
+        self._titulos: List[str] = []
+        # Byte alto de cada valor de la firma: basta para estimar el Jaccard entre dos titulares
+        self._resumenes: List[int] = []
+        # Llamadas a es_similar (o a `similar`) hechas por buscar_similar
+        self.comparaciones = 0
+
+    def __len__(self) -> int:
+        return len(self._titulos)
+
+    def _shingles(self, titulo: str) -> List[int]:
+        t = norm(titulo)
+        if len(t) <= self.ngram:
+            piezas = {t}
+        else:
+            piezas = {t[i:i + self.ngram] for i in range(len(t) - self.ngram + 1)}
+        hashes = []
+        for pieza in piezas:
+            h = (zlib.crc32(pieza.encode("utf-8"), self.seed) * 0x9E3779B1) & self._MASCARA
+            hashes.append(h ^ (h >> 16))
+        return hashes
+
+    def firma(self, titulo: str) -> Tuple[int, ...]:
+        k = self.bandas * self.filas
+        cajas: List[Optional[int]] = [None] * k
+        for h in self._shingles(titulo):
+            caja = h % k
+            actual = cajas[caja]
+            if actual is None or h < actual:
+                cajas[caja] = h
+        firma = list(cajas)
+        for j in range(k):
+            if firma[j] is not None:
+                continue
+            for caja in self._sondas[j]:
+                valor = cajas[caja]
+                if valor is not None:
+                    firma[j] = valor
+                    break
+            else:
+                # Titular con muy pocos 4-gramas: la siguiente caja llena a la derecha
+                firma[j] = next(cajas[(j + t) % k] for t in range(1, k) if cajas[(j + t) % k] is not None)
+        return tuple(firma)
+
+    @staticmethod
+    def _resumen(firma: Tuple[int, ...]) -> int:
+        # El byte alto de cada valor (el bajo depende en parte de la caja: valor % k == caja),
+        # empaquetados en un entero para comparar dos firmas con un solo XOR
+        return int.from_bytes(bytes(v >> 24 for v in firma), "big")
+
+    def _parecido(self, a: int, b: int) -> float:
+        """Jaccard estimado: fracción de bytes iguales (descontado el 1/256 que coincide al azar)."""
+        k = self.bandas * self.filas
+        iguales = (a ^ b).to_bytes(k, "big").count(0) / k
+        return (iguales - 1 / 256) / (1 - 1 / 256)
+
+    def _claves(self, firma: Tuple[int, ...]):
+        f = self.filas
+        for banda in range(self.bandas):
+            # hash() de una tupla de enteros no depende de PYTHONHASHSEED: vale entre procesos
+            yield banda, hash(firma[banda * f:(banda + 1) * f])
+
+    def _miembros(self, banda: int, clave: int) -> Iterable[int]:
+        miembros = self._cubetas[banda].get(clave)
+        if miembros is None:
+            return ()
+        return miembros if isinstance(miembros, list) else (miembros,)
+
+    def _candidatos(self, firma: Tuple[int, ...]) -> List[int]:
+        """Índices que comparten cubeta y pasan el umbral, del más al menos parecido (como
+        mucho `max_verificaciones`; a igualdad, el que se agregó antes)."""
+        resumen = self._resumen(firma)
+        parecidos: Dict[int, float] = {}
+        for banda, clave in self._claves(firma):
+            for idx in self._miembros(banda, clave):
+                if idx not in parecidos:
+                    parecidos[idx] = self._parecido(resumen, self._resumenes[idx])
+        elegidos = [idx for idx, p in parecidos.items() if p >= self.umbral]
+        elegidos.sort(key=lambda idx: (-parecidos[idx], idx))
+        return elegidos[:self.max_verificaciones]
+
+    def buscar_similar(self, titulo: str, firma: Optional[Tuple[int, ...]] = None, similar=None) -> Optional[int]:
+        """Índice (orden de `agregar`) del titular similar ya visto más parecido, o None.
+
+        `similar(a, b)` sustituye a `es_similar` (p. ej. con comparaciones ya calculadas).
+        """
+        if firma is None:
+            firma = self.firma(titulo)
+        if similar is None:
+            similar = es_similar
+        titulo_l = titulo.lower()
+        for idx in self._candidatos(firma):
+            self.comparaciones += 1
+            if similar(titulo_l, self._titulos[idx].lower()):
+                return idx
+        return None
+
+    def pares_candidatos(self, lote: List[Tuple[str, Tuple[int, ...], bool]]) -> set:
+        """Pares (titular, candidato) en minúsculas que `buscar_similar` podría comparar si los
+        titulares del lote (titular, firma, puede_agregarse) llegan en orden: los ya indexados
+        que comparten cubeta y, por si acaban aceptados, los anteriores del lote que pueden
+        agregarse, siempre que pasen el umbral. Sin el tope de `max_verificaciones` (depende de
+        qué se acabe agregando), así que es un superconjunto de lo necesario."""
+        pares = set()
+        del_lote: List[Dict[int, List[int]]] = [{} for _ in range(self.bandas)]
+        previos: List[Tuple[str, int]] = []
+        for titulo, firma, puede_agregarse in lote:
+            titulo_l = titulo.lower()
+            resumen = self._resumen(firma)
+            vistos, vistos_lote = set(), set()
+            for banda, clave in self._claves(firma):
+                for idx in self._miembros(banda, clave):
+                    if idx not in vistos:
+                        vistos.add(idx)
+                        if self._parecido(resumen, self._resumenes[idx]) >= self.umbral:
+                            pares.add((titulo_l, self._titulos[idx].lower()))
+                for i in del_lote[banda].get(clave, ()):
+                    if i not in vistos_lote:
+                        vistos_lote.add(i)
+                        otro, resumen_otro = previos[i]
+                        if self._parecido(resumen, resumen_otro) >= self.umbral:
+                            pares.add((titulo_l, otro))
+            if puede_agregarse:
+                for banda, clave in self._claves(firma):
+                    del_lote[banda].setdefault(clave, []).append(len(previos))
+                previos.append((titulo_l, resumen))
+        return pares
+
+    def es_duplicado(self, titulo: str, firma: Optional[Tuple[int, ...]] = None) -> bool:
+        return self.buscar_similar(titulo, firma) is not None
+
+    def agregar(self, titulo: str, firma: Optional[Tuple[int, ...]] = None) -> int:
+        if firma is None:
+            firma = self.firma(titulo)
+        idx = len(self._titulos)
+        self._titulos.append(titulo)
+        self._resumenes.append(self._resumen(firma))
+        for banda, clave in self._claves(firma):
+            cubeta = self._cubetas[banda]
+            miembros = cubeta.get(clave)
+            if miembros is None:
+                cubeta[clave] = idx
+            elif isinstance(miembros, list):
+                miembros.append(idx)
+            else:
+                cubeta[clave] = [miembros, idx]
+        return idx
+
+# ✅ MUST CHANGE #3: published date robusto
+def get_published(articulo: Dict[str, Any]) -> str:
+    return (
+        articulo.get("published date")
+        or articulo.get("published_date")
+        or articulo.get("pubDate")
+        or articulo.get("published")
+        or "N/D"
+    )
+
+def fecha_publicacion(articulo: Dict[str, Any]) -> Optional[datetime]:
+    """Fecha de publicación como datetime con zona horaria, o None si no se puede leer."""
+    return parse_fecha(get_published(articulo))
+
+def parse_fecha(valor: str) -> Optional[datetime]:
+    """RFC 2822 (RSS) o ISO 8601 a datetime con zona horaria; None si no se puede leer."""
+    if not valor or valor == "N/D":
+        return None
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError, IndexError):
+        try:
+            fecha = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha
+
+def puntuar(temas: List[str], dom: str, publisher: str, fecha: Optional[datetime]) -> float:
+    """Relevancia = temas × peso del medio × frescura.
+
+    Temas: el mayor peso de cada categoría encontrada más 0.25 por keyword adicional.
+    Frescura: de 1.0 (recién publicada) hacia 0.5, con vida media RELEVANCIA_VIDA_MEDIA_H.
+    """
+    por_categoria: Dict[str, float] = {}
+    for kw in temas:
+        cat = _CATEGORIA_KEYWORD.get(kw, "")
+        por_categoria[cat] = max(por_categoria.get(cat, 0.0), PESOS_CATEGORIA.get(cat, 1.0))
+    puntos_temas = sum(por_categoria.values()) + 0.25 * max(0, len(set(temas)) - len(por_categoria))
+
+    peso_fuente = 1.0
+    if dom and dom != "news.google.com":
+        peso_fuente = _PESOS_FUENTE_NORM.get(dom, 1.0)
+    elif publisher:
+        peso_fuente = _PESOS_FUENTE_NORM.get(clave_publisher(publisher), 1.0)
+
+    frescura = 0.5
+    if fecha is not None:
+        horas = max(0.0, (datetime.now(timezone.utc) - fecha).total_seconds() / 3600)
+        frescura = 0.5 ** (horas / max(RELEVANCIA_VIDA_MEDIA_H, 0.1))
+    return round(puntos_temas * peso_fuente * (0.5 + 0.5 * frescura), 4)
+
+class Noticia:
+    """Noticia aceptada. `temas` es una máscara de bits sobre TABLA_TEMAS y las cadenas que se
+    repiten entre noticias (tipo, entidad, dominio, medio) están internadas."""
+
+    __slots__ = (
+        "tipo", "entidad", "temas", "titulo", "url", "url_original",
+        "fecha", "fuente", "dominio", "etiquetas", "puntuacion",
+    )
+
+    def __init__(
+        self,
+        tipo: str,
+        entidad: str,
+        temas: int,
+        titulo: str,
+        url: str,
+        url_original: str = "",
+        fecha: str = "N/D",
+        fuente: str = "",
+        dominio: str = "",
+        etiquetas: Optional[List[Tuple[str, str]]] = None,
+        puntuacion: float = 0.0,
+    ) -> None:
+        self.tipo = sys.intern(tipo)
+        self.entidad = sys.intern(entidad)
+        self.temas = temas
+        self.titulo = titulo
+        self.url = url
+        self.url_original = url_original or url
+        self.fecha = fecha
+        self.fuente = sys.intern(fuente)
+        self.dominio = sys.intern(dominio)
+        self.etiquetas = etiquetas if etiquetas is not None else [(self.tipo, self.entidad)]
+        self.puntuacion = puntuacion
+
+    @property
+    def temas_texto(self) -> str:
+        return texto_temas(self.temas)
+
+    def lista_temas(self) -> List[str]:
+        return bits_a_temas(self.temas)
+
+    def a_dict(self) -> Dict[str, Any]:
+        """Representación JSON (mismo formato que el backfill guardaba antes)."""
+        return {
+            "tipo": self.tipo,
+            "entidad": self.entidad,
+            "temas": self.temas_texto,
+            "titulo": self.titulo,
+            "url": self.url,
+            "fecha": self.fecha,
+            "fuente": self.fuente,
+            "dominio": self.dominio,
+            "etiquetas": [{"tipo": t, "entidad": e} for t, e in self.etiquetas],
+            "url_original": self.url_original,
+            "puntuacion": self.puntuacion,
+        }
+
+    def __repr__(self) -> str:
+        return f"Noticia({self.tipo}/{self.entidad}: {self.titulo[:60]!r})"
+
+class SelectorTopK:
+    """Se queda con las `por_entidad` mejores noticias de cada (tipo, entidad) con un min-heap
+    por entidad, y al final con las `por_seccion` mejores de cada tipo. 0 = sin límite."""
+
+    def __init__(self, por_entidad: int, por_seccion: int) -> None:
+        self.por_entidad = por_entidad
+        self.por_seccion = por_seccion
+        self._heaps: Dict[Tuple[str, str], List[Tuple[float, int, Noticia]]] = {}
+        self._seq = 0
+
+    def agregar(self, noticia: Noticia) -> None:
+        # (puntuación, -orden): a igual puntuación gana la que llegó antes
+        entrada = (noticia.puntuacion, -self._seq, noticia)
+        self._seq += 1
+        heap = self._heaps.setdefault((noticia.tipo, noticia.entidad), [])
+        if not self.por_entidad or len(heap) < self.por_entidad:
+            heapq.heappush(heap, entrada)
+        elif entrada[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entrada)
+
+    def resultado(self, tipo: str) -> List[Noticia]:
+        """Noticias seleccionadas del tipo, de mayor a menor puntuación."""
+        candidatas = [e for (t, _), heap in self._heaps.items() if t == tipo for e in heap]
+        clave = lambda e: e[:2]
+        if self.por_seccion:
+            elegidas = heapq.nlargest(self.por_seccion, candidatas, key=clave)
+        else:
+            elegidas = sorted(candidatas, key=clave, reverse=True)
+        return [e[2] for e in elegidas]
+
+def huella_titulo(titulo: str) -> str:
+    """Huella estable del titular: sin acentos, mayúsculas ni puntuación."""
+    t = " ".join(re.findall(r"\w+", plegar(titulo)))
+    return hashlib.sha1(t.encode("utf-8")).hexdigest()[:16]
+
+class IndiceArticulos:
+    """Índice de artículos compartido por toda la ejecución (clientes, competidores y partners).
+
+    Cada noticia se resuelve y filtra una sola vez. Si vuelve a aparecer (misma URL original
+    o final, misma huella de titular o titular casi idéntico) solo se le añade la etiqueta
+    (tipo, entidad). Los rechazos se recuerdan por URL original para no repetir el trabajo.
+    """
+
+    def __init__(self) -> None:
+        self.detector = DetectorDuplicados()
+        self._por_url: Dict[str, Noticia] = {}
+        self._por_huella: Dict[str, Noticia] = {}
+        self._por_detector: List[Noticia] = []
+        self._rechazadas: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._por_detector)
+
+    def aceptadas(self) -> List[Noticia]:
+        """Todas las noticias aceptadas (una vez cada una), en orden de aceptación."""
+        return list(self._por_detector)
+
+    def buscar(self, url: str, titulo: str) -> Optional[Noticia]:
+        return self._por_url.get(url) or self._por_huella.get(huella_titulo(titulo))
+
+    def buscar_similar(self, titulo: str, firma: Optional[Tuple[int, ...]] = None, similar=None) -> Optional[Noticia]:
+        idx = self.detector.buscar_similar(titulo, firma, similar)
+        return None if idx is None else self._por_detector[idx]
+
+    @staticmethod
+    def etiquetar(noticia: Noticia, tipo: str, entidad: str) -> None:
+        etiqueta = (tipo, entidad)
+        if etiqueta not in noticia.etiquetas:
+            noticia.etiquetas.append(etiqueta)
+
+    def registrar(self, noticia: Noticia, url_original: str, firma: Optional[Tuple[int, ...]] = None) -> None:
+        self._por_url[url_original] = noticia
+        self._por_url[noticia.url] = noticia
+        self._por_huella[huella_titulo(noticia.titulo)] = noticia
+        self.detector.agregar(noticia.titulo, firma)
+        self._por_detector.append(noticia)
+
+    def rechazar(self, url_original: str, motivo: str) -> None:
+        self._rechazadas[url_original] = motivo
+
+    def rechazo(self, url_original: str) -> Optional[str]:
+        return self._rechazadas.get(url_original)
+
+class BloomFilter:
+    """Filtro de Bloom en un bytearray con doble hashing sobre blake2b."""
+
+    def __init__(self, capacidad: int, error: float = 0.01) -> None:
+        capacidad = max(capacidad, 1000)
+        self.bits = max(8, int(-capacidad * math.log(error) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacidad * math.log(2))))
+        self._datos = bytearray((self.bits + 7) // 8)
+
+    def _posiciones(self, clave: str):
+        digest = hashlib.blake2b(clave.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, clave: str) -> None:
+        for pos in self._posiciones(clave):
+            self._datos[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, clave: str) -> bool:
+        return all(self._datos[pos >> 3] & (1 << (pos & 7)) for pos in self._posiciones(clave))
+
+class SeenStore:
+    """Noticias ya enviadas en ejecuciones anteriores (SQLite con un filtro de Bloom delante).
+
+    Las claves son "u:<url>" (original y final) y "f:<huella del titular>". El Bloom, cargado
+    al abrir, responde sin tocar SQLite para casi todo lo que no se ha enviado nunca; solo
+    los positivos se confirman con una consulta. Guarda también la marca de agua de la
+    última ejecución correcta. Con `path` vacío no recuerda nada.
+    """
+
+    def __init__(self, path: str, retention_days: float, compact_min_deleted: int) -> None:
+        self.path = path
+        self.retention_seconds = retention_days * 86400
+        self.compact_min_deleted = compact_min_deleted
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bloom = BloomFilter(1000)
+        if not path:
+            return
+        carpeta = os.path.dirname(path)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vistas (clave TEXT PRIMARY KEY, ts REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS vistas_ts ON vistas (ts)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS estado (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+        self._conn.commit()
+        self.compactar()
+        total = self._conn.execute("SELECT COUNT(*) FROM vistas").fetchone()[0]
+        self._bloom = BloomFilter(total * 2)
+        for (clave,) in self._conn.execute("SELECT clave FROM vistas"):
+            self._bloom.add(clave)
+
+    @staticmethod
+    def claves(url: str = "", titulo: str = "", final_url: str = "") -> List[str]:
+        out = [f"u:{u}" for u in (url, final_url) if u]
+        if titulo:
+            out.append(f"f:{huella_titulo(titulo)}")
+        return out
+
+    def contiene(self, claves: Iterable[str]) -> bool:
+        candidatas = [c for c in claves if c in self._bloom]
+        if not candidatas:
+            return False
+        with self._lock:
+            if self._conn is None:
+                return False
+            marcas = ",".join("?" * len(candidatas))
+            fila = self._conn.execute(f"SELECT 1 FROM vistas WHERE clave IN ({marcas}) LIMIT 1", candidatas).fetchone()
+            return fila is not None
+
+    def marcar(self, claves: Iterable[str]) -> None:
+        ahora = time.time()
+        with self._lock:
+            if self._conn is None:
+                return
+            filas = [(c, ahora) for c in claves]
+            self._conn.executemany("INSERT OR REPLACE INTO vistas (clave, ts) VALUES (?, ?)", filas)
+            self._conn.commit()
+            for c, _ in filas:
+                self._bloom.add(c)
+
+    def watermark(self) -> Optional[float]:
+        with self._lock:
+            if self._conn is None:
+                return None
+            fila = self._conn.execute("SELECT valor FROM estado WHERE clave = 'watermark'").fetchone()
+            return float(fila[0]) if fila else None
+
+    def set_watermark(self, ts: float) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute("INSERT OR REPLACE INTO estado (clave, valor) VALUES ('watermark', ?)", (str(ts),))
+            self._conn.commit()
+
+    def compactar(self) -> int:
+        """Borra lo que supera la retención y hace VACUUM si se ha borrado bastante."""
+        with self._lock:
+            if self._conn is None:
+                return 0
+            cur = self._conn.execute("DELETE FROM vistas WHERE ts < ?", (time.time() - self.retention_seconds,))
+            borradas = cur.rowcount
+            self._conn.commit()
+            if borradas >= self.compact_min_deleted:
+                self._conn.execute("VACUUM")
+            return borradas
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_SEEN_STORE: Optional[SeenStore] = None
+_SEEN_STORE_LOCK = threading.Lock()
+
+def seen_store() -> SeenStore:
+    global _SEEN_STORE
+    with _SEEN_STORE_LOCK:
+        if _SEEN_STORE is None:
+            _SEEN_STORE = SeenStore(SEEN_STORE_PATH, SEEN_RETENTION_DAYS, SEEN_COMPACT_MIN_DELETED)
+        return _SEEN_STORE
+
+class HistoricoStore:
+    """Histórico append-only de noticias aceptadas y rechazos por ejecución (SQLite indexado).
+
+    Una fila por etiqueta (tipo, entidad) en `menciones` y por tema en `temas`, con el día y
+    la semana ISO de publicación ya calculados. Unos triggers mantienen agregados diarios
+    (`menciones_dia`, `temas_dia`) ordenados por día: las consultas de tendencias leen solo
+    ese rango de esas tablas, sin tocar titulares ni URLs. Volver a guardar la misma
+    noticia no la duplica.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if not path:
+            return
+        carpeta = os.path.dirname(path)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ejecuciones (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, dia TEXT NOT NULL,
+                modo TEXT NOT NULL, aceptadas INTEGER NOT NULL, enviado INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS articulos (
+                url TEXT PRIMARY KEY, titulo TEXT, fecha TEXT, dia TEXT NOT NULL, fuente TEXT,
+                dominio TEXT, temas TEXT, puntuacion REAL, ejecucion INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS menciones (
+                url TEXT NOT NULL, tipo TEXT NOT NULL, entidad TEXT NOT NULL,
+                dia TEXT NOT NULL, semana TEXT NOT NULL, PRIMARY KEY (url, tipo, entidad)
+            );
+            CREATE TABLE IF NOT EXISTS temas (
+                url TEXT NOT NULL, tipo TEXT NOT NULL, entidad TEXT NOT NULL, tema TEXT NOT NULL,
+                dia TEXT NOT NULL, PRIMARY KEY (url, tipo, entidad, tema)
+            );
+            -- Agregados diarios mantenidos por triggers (INSERT OR IGNORE no los dispara si ya existía)
+            CREATE TABLE IF NOT EXISTS menciones_dia (
+                dia TEXT NOT NULL, tipo TEXT NOT NULL, entidad TEXT NOT NULL, semana TEXT NOT NULL,
+                n INTEGER NOT NULL, PRIMARY KEY (dia, tipo, entidad)
+            ) WITHOUT ROWID;
+            CREATE TRIGGER IF NOT EXISTS menciones_dia_ai AFTER INSERT ON menciones BEGIN
+                INSERT INTO menciones_dia VALUES (NEW.dia, NEW.tipo, NEW.entidad, NEW.semana, 1)
+                ON CONFLICT (dia, tipo, entidad) DO UPDATE SET n = n + 1;
+            END;
+            CREATE TABLE IF NOT EXISTS temas_dia (
+                tipo TEXT NOT NULL, dia TEXT NOT NULL, entidad TEXT NOT NULL, tema TEXT NOT NULL,
+                n INTEGER NOT NULL, PRIMARY KEY (tipo, dia, entidad, tema)
+            ) WITHOUT ROWID;
+            CREATE TRIGGER IF NOT EXISTS temas_dia_ai AFTER INSERT ON temas BEGIN
+                INSERT INTO temas_dia VALUES (NEW.tipo, NEW.dia, NEW.entidad, NEW.tema, 1)
+                ON CONFLICT (tipo, dia, entidad, tema) DO UPDATE SET n = n + 1;
+            END;
+            CREATE TABLE IF NOT EXISTS rechazos (
+                ejecucion INTEGER NOT NULL, dia TEXT NOT NULL, motivo TEXT NOT NULL, n INTEGER NOT NULL,
+                PRIMARY KEY (ejecucion, motivo)
+            );
+            CREATE INDEX IF NOT EXISTS rechazos_dia ON rechazos (dia, motivo, n);
+        """)
+        self._conn.commit()
+
+    def guardar(
+        self,
+        noticias: Iterable[Noticia],
+        rechazos: Dict[str, int],
+        modo: str = "diario",
+        enviado: bool = False,
+    ) -> Optional[int]:
+        """Añade las noticias aceptadas de una ejecución y sus contadores de rechazo.
+
+        Se guarda todo lo aceptado tras deduplicar (`IndiceArticulos.aceptadas()`), no solo
+        el top-K enviado: si no, las tendencias quedarían topadas por TOPK_POR_ENTIDAD.
+        """
+        if self._conn is None:
+            return None
+        ahora = datetime.now(timezone.utc)
+        hoy = ahora.date()
+        articulos, menciones, temas = [], [], []
+        for n in noticias:
+            fecha = parse_fecha(n.fecha)
+            dia = fecha.date() if fecha is not None else hoy
+            semana = dia.strftime("%G-W%V")
+            articulos.append((
+                n.url, n.titulo, n.fecha, dia.isoformat(), n.fuente,
+                n.dominio, n.temas_texto, n.puntuacion,
+            ))
+            temas_noticia = [t.upper() for t in n.lista_temas()]
+            for tipo, entidad in n.etiquetas:
+                menciones.append((n.url, tipo, entidad, dia.isoformat(), semana))
+                temas.extend((n.url, tipo, entidad, t, dia.isoformat()) for t in temas_noticia)
+
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO ejecuciones (ts, dia, modo, aceptadas, enviado) VALUES (?, ?, ?, ?, ?)",
+                (ahora.timestamp(), hoy.isoformat(), modo, len(articulos), int(enviado)),
+            )
+            ejecucion = cur.lastrowid
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO articulos (url, titulo, fecha, dia, fuente, dominio, temas, puntuacion, ejecucion)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [a + (ejecucion,) for a in articulos],
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO menciones VALUES (?, ?, ?, ?, ?)", menciones)
+            self._conn.executemany("INSERT OR IGNORE INTO temas VALUES (?, ?, ?, ?, ?)", temas)
+            self._conn.executemany(
+                "INSERT INTO rechazos VALUES (?, ?, ?, ?)",
+                [(ejecucion, hoy.isoformat(), motivo, n) for motivo, n in sorted(rechazos.items()) if n],
+            )
+            self._conn.commit()
+        return ejecucion
+
+    def _consulta(self, sql: str, params: List[Any]):
+        import pandas as pd  # solo para analítica: la ejecución diaria no lo necesita
+
+        if self._conn is None:
+            return pd.DataFrame()
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    @staticmethod
+    def _rango(desde: Optional[date], hasta: Optional[date]) -> List[str]:
+        return [(desde or date.min).isoformat(), (hasta or date.max).isoformat()]
+
+    def menciones_por_semana(
+        self,
+        desde: Optional[date] = None,
+        hasta: Optional[date] = None,
+        tipo: Optional[str] = None,
+        entidades: Optional[List[str]] = None,
+    ):
+        """DataFrame semana ISO × entidad con el nº de noticias que mencionan a cada entidad."""
+        sql = "SELECT semana, entidad, SUM(n) AS menciones FROM menciones_dia WHERE dia BETWEEN ? AND ?"
+        params: List[Any] = self._rango(desde, hasta)
+        if tipo:
+            sql += " AND tipo = ?"
+            params.append(tipo)
+        if entidades:
+            sql += f" AND entidad IN ({','.join('?' * len(entidades))})"
+            params.extend(entidades)
+        df = self._consulta(sql + " GROUP BY semana, entidad", params)
+        if df.empty:
+            return df
+        return df.pivot(index="semana", columns="entidad", values="menciones").fillna(0).astype(int).sort_index()
+
+    def top_temas(
+        self,
+        tipo: str = "competidor",
+        desde: Optional[date] = None,
+        hasta: Optional[date] = None,
+        n: int = 5,
+    ):
+        """Los `n` temas más frecuentes de cada entidad del tipo (entidad, tema, menciones)."""
+        df = self._consulta(
+            "SELECT entidad, tema, SUM(n) AS menciones FROM temas_dia"
+            " WHERE tipo = ? AND dia BETWEEN ? AND ? GROUP BY entidad, tema",
+            [tipo] + self._rango(desde, hasta),
+        )
+        if df.empty:
+            return df
+        df = df.sort_values(["entidad", "menciones", "tema"], ascending=[True, False, True])
+        return df.groupby("entidad", sort=False).head(n).reset_index(drop=True)
+
+    def rechazos_por_dia(self, desde: Optional[date] = None, hasta: Optional[date] = None):
+        """DataFrame día × motivo con los artículos rechazados."""
+        df = self._consulta(
+            "SELECT dia, motivo, SUM(n) AS n FROM rechazos WHERE dia BETWEEN ? AND ? GROUP BY dia, motivo",
+            self._rango(desde, hasta),
+        )
+        if df.empty:
+            return df
+        return df.pivot(index="dia", columns="motivo", values="n").fillna(0).astype(int).sort_index()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_HISTORICO: Optional[HistoricoStore] = None
+_HISTORICO_LOCK = threading.Lock()
+
+def historico() -> HistoricoStore:
+    global _HISTORICO
+    with _HISTORICO_LOCK:
+        if _HISTORICO is None:
+            _HISTORICO = HistoricoStore(HISTORY_PATH)
+        return _HISTORICO
+
+def contadores_rechazo() -> Dict[str, int]:
+    """Rechazos de la ejecución en curso por motivo, a partir de las métricas."""
+    out = {}
+    for clave, n in METRICAS.informe()["contadores"].items():
+        if clave.startswith("rechazadas."):
+            out[clave.split(".", 1)[1]] = n
+        elif clave in ("ya_vistas", "rechazo_repetido"):
+            out[clave] = n
+    return out
+
+class _Item:
+    """Artículo en tránsito por el pipeline. `motivo` marca el rechazo sin sacarlo del flujo."""
+
+    __slots__ = (
+        "seq", "tipo", "entidades", "titulo", "descripcion", "url", "publicado", "medio",
+        "final_url", "dom", "publisher", "temas", "prohibida", "motivo", "idioma", "cuerpo", "firma",
+    )
+
+    def __init__(self, seq: int, tipo: str, entidades: List[str], articulo: Dict[str, Any], idioma: str = IDIOMA_BASE) -> None:
+        # Solo se copian los campos que usa el pipeline: el dict de GNews no viaja por las colas
+        self.seq = seq
+        self.tipo = tipo
+        self.entidades = entidades
+        self.idioma = idioma
+        self.titulo = (articulo.get("title") or "").strip()
+        self.descripcion = articulo.get("description") or ""
+        self.url = (articulo.get("url") or articulo.get("link") or "").strip()
+        self.publicado = get_published(articulo)
+        self.medio = ((articulo.get("publisher") or {}).get("title") or "").strip()
+        self.final_url = ""
+        self.dom = ""
+        self.publisher = ""
+        self.temas: List[str] = []
+        self.prohibida = False
+        self.motivo = ""
+        self.cuerpo = ""
+        self.firma: Optional[Tuple[int, ...]] = None
+
+_FIN = object()
+
+def _emitir_articulos(
+    entidades: List[str],
+    tipo: str,
+    lote: List[str],
+    resultados: List[Dict[str, Any]],
+    salida: "queue.Queue[Any]",
+    seq: int,
+    idioma: str = IDIOMA_BASE,
+    en_vuelo: Optional[threading.BoundedSemaphore] = None,
+) -> int:
+    """Atribuye cada artículo a las entidades del lote que menciona y lo pasa a la siguiente
+    etapa con números de secuencia consecutivos. Devuelve el siguiente número libre.
+    Con `en_vuelo`, cada número ocupa un hueco hasta que el recolector lo saca en orden."""
+    matcher = entity_matcher(tuple(entidades))
+    tipo = sys.intern(tipo)
+    idioma = sys.intern(idioma)
+    lote = [sys.intern(e) for e in lote]
+    for articulo in resultados:
+        if len(lote) == 1:
+            entidades_articulo = lote
+        else:
+            texto = (articulo.get("title") or "") + " " + (articulo.get("description") or "")
+            entidades_articulo = [sys.intern(e) for e in matcher.entidades_en(texto) if e in lote]
+            if not entidades_articulo:
+                METRICAS.sumar("rechazadas.sin entidad")
+                debug_log(f"    ⛔ RECHAZADA (sin entidad) '{(articulo.get('title') or '')[:80]}'")
+                continue
+        if en_vuelo is not None:
+            en_vuelo.acquire()
+        salida.put(_Item(seq, tipo, entidades_articulo, articulo, idioma))
+        seq += 1
+    return seq
+
+def _productor(
+    grupos: List[Tuple[List[str], str]],
+    salida: "queue.Queue[Any]",
+    en_vuelo: Optional[threading.BoundedSemaphore] = None,
+) -> None:
+    """Etapa fetch: descarga los lotes con una ventana acotada de futures y emite artículos en orden.
+
+    Cada lote se consulta en todas sus ediciones (locales) a la vez, dentro de la misma ventana.
+    Las consultas que fallan (429/503, timeout, circuito abierto) se apartan y se repiten en
+    hasta GNEWS_PASADAS_REINTENTO pasadas al final, esperando a que el circuito se cierre.
+    """
+    lotes = [
+        (entidades, tipo, locale, lote)
+        for entidades, tipo in grupos
+        for locale, lote in lotes_por_locale(entidades)
+    ]
+    totales: Dict[str, int] = {}
+    for _, tipo, _, _ in lotes:
+        totales[tipo] = totales.get(tipo, 0) + 1
+
+    pool = _fetch_pool()
+    seq = 0
+    vistos: Dict[str, int] = {}
+
+    def pasada(pendientes: Iterable[Tuple[List[str], str, str, List[str]]], hasta: Optional[float]) -> List[Tuple[List[str], str, str, List[str]]]:
+        nonlocal seq
+        pendientes = iter(pendientes)
+        ventana: "deque[Tuple[List[str], str, str, List[str], Future]]" = deque()
+        fallidos: List[Tuple[List[str], str, str, List[str]]] = []
+
+        def lanzar() -> None:
+            siguiente = next(pendientes, None)
+            if siguiente is not None:
+                entidades, tipo, locale, lote = siguiente
+                futuro = pool.submit(descargar_noticias, consulta_gnews(lote), hasta, None, locale)
+                ventana.append((entidades, tipo, locale, lote, futuro))
+
+        # Como mucho 2 descargas en cola por hilo: la memoria no crece con el nº de entidades
+        for _ in range(max(1, FETCH_WORKERS) * 2):
+            lanzar()
+
+        while ventana:
+            entidades, tipo, locale, lote, futuro = ventana.popleft()
+            lanzar()
+            nombre_lote = ", ".join(lote) + ("" if locale == GNEWS_LOCALES[0] else f" [{locale}]")
+            try:
+                resultados = futuro.result()
+            except CircuitoAbierto as e:
+                METRICAS.sumar("gnews_aplazadas")
+                debug_log(f"    ⏸️ Aplazada {nombre_lote} ({tipo}): {e}")
+                fallidos.append((entidades, tipo, locale, lote))
+                continue
+            except Exception as e:
+                METRICAS.sumar("gnews_errores")
+                print(f"⚠️ Error {nombre_lote} ({tipo}): {e}")
+                fallidos.append((entidades, tipo, locale, lote))
+                continue
+            vistos[tipo] = vistos.get(tipo, 0) + 1
+            print(f"[{vistos[tipo]}/{totales[tipo]}] 🔹 {nombre_lote} ({tipo})... {len(resultados)} analizadas.")
+            seq = _emitir_articulos(entidades, tipo, lote, resultados, salida, seq, idioma_locale(locale), en_vuelo)
+        return fallidos
+
+    try:
+        fallidos = pasada(lotes, None)
+        for n in range(GNEWS_PASADAS_REINTENTO):
+            if not fallidos:
+                break
+            print(f"🔁 Reintento {n + 1}/{GNEWS_PASADAS_REINTENTO}: {len(fallidos)} consulta(s) fallida(s)...")
+            METRICAS.sumar("gnews_reintentos", len(fallidos))
+            fallidos = pasada(fallidos, time.monotonic() + GNEWS_REINTENTO_MAX_ESPERA_S)
+        for _, tipo, locale, lote in fallidos:
+            METRICAS.sumar("gnews_perdidas")
+            print(f"❌ Sin noticias de {', '.join(lote)} ({tipo}, {locale}) tras los reintentos.")
+    finally:
+        salida.put(_FIN)
+
+def _lanzar_etapa(
+    nombre: str,
+    fn,
+    entrada: "queue.Queue[Any]",
+    salida: "queue.Queue[Any]",
+    workers: int,
+) -> None:
+    """Arranca `workers` hilos que aplican `fn` a cada item; al terminar todos, propaga el fin."""
+
+    def trabajador() -> None:
+        while True:
+            item = entrada.get()
+            if item is _FIN:
+                entrada.put(_FIN)  # para los demás hilos de la etapa
+                return
+            if not item.motivo:
+                try:
+                    with METRICAS.cronometro(nombre):
+                        fn(item)
+                except Exception as e:
+                    item.motivo = "error"
+                    print(f"⚠️ Error en {nombre} '{item.titulo[:80]}': {e}")
+            salida.put(item)
+
+    hilos = [
+        threading.Thread(target=trabajador, name=f"{nombre}-{i}", daemon=True)
+        for i in range(max(1, workers))
+    ]
+    for h in hilos:
+        h.start()
+
+    def cierre() -> None:
+        for h in hilos:
+            h.join()
+        salida.put(_FIN)
+
+    threading.Thread(target=cierre, name=f"{nombre}-cierre", daemon=True).start()
+
+def _etapa_medio(item: _Item, indice: "IndiceArticulos", vistas: Optional[SeenStore], corte: Optional[float]) -> None:
+    if not item.titulo or not item.url:
+        item.motivo = "vacía"
+        return
+    # Lo ya enviado en días anteriores se descarta antes de resolver la URL
+    if vistas is not None:
+        if vistas.contiene(SeenStore.claves(item.url, item.titulo)):
+            item.motivo = "ya enviada"
+            return
+        if corte is not None:
+            fecha = parse_fecha(item.publicado)
+            if fecha is not None and fecha.timestamp() < corte:
+                item.motivo = "anterior"
+                return
+    # Lectura sin bloqueo del índice: si la noticia ya se procesó no se vuelve a resolver.
+    # El recolector lo comprueba otra vez, así que una lectura desfasada solo cuesta trabajo.
+    if indice.rechazo(item.url):
+        item.motivo = "rechazo_repetido"
+        return
+    if indice.buscar(item.url, item.titulo) is not None:
+        item.motivo = "ya_vista"
+        return
+    allowed, dom, item.final_url, item.publisher = comprobar_fuente(item.url, item.medio)
+    item.dom = sys.intern(dom)
+    if not allowed:
+        item.motivo = "medio"
+        return
+    if vistas is not None and item.final_url != item.url and vistas.contiene(SeenStore.claves(final_url=item.final_url)):
+        item.motivo = "ya enviada"
+
+def _etapa_texto(item: _Item, indice: "IndiceArticulos", limite: float) -> None:
+    # Lo que el recolector va a descartar como ya visto no se descarga
+    if item.dom == "news.google.com" or indice.buscar(item.final_url, item.titulo) is not None:
+        return
+    item.cuerpo = texto_articulo(item.final_url, descargar=time.monotonic() < limite)
+    METRICAS.sumar("enrich_con_texto" if item.cuerpo else "enrich_sin_texto")
+
+def analizar_texto(idioma: str, titulo: str, descripcion: str, cuerpo: str = "") -> Tuple[List[str], bool]:
+    """(temas, hay_prohibida) de un artículo con las keywords de su idioma."""
+    texto_analizar = (titulo + " " + descripcion).lower()
+    matcher = _KEYWORD_MATCHERS.get(idioma, _KEYWORD_MATCHER)
+    if not cuerpo:
+        return matcher.analizar(texto_analizar)
+    cuerpo = cuerpo.lower()
+    temas, _ = matcher.analizar(texto_analizar + "\n" + cuerpo)
+    return temas, matcher.contiene_prohibida(texto_analizar + "\n" + cuerpo[:ENRICH_PROHIBIDAS_CHARS])
+
+def _etapa_keywords(item: _Item) -> None:
+    item.temas, item.prohibida = analizar_texto(item.idioma, item.titulo, item.descripcion, item.cuerpo)
+    item.cuerpo = ""  # ya no hace falta: no viaja hasta el recolector
+
+# --- Modo multiproceso (PIPELINE_PROCESOS) ---
+
+def _iniciar_worker_cpu(config: Dict[str, Any], artefactos: Dict[str, Any]) -> None:
+    # La configuración del proceso principal, no la del fichero: puede haberse recargado
+    aplicar_config(config, artefactos)
+
+def _analizar_lote(textos: List[Tuple[str, str, str, str]]) -> List[Tuple[List[str], bool, Tuple[int, ...]]]:
+    """En un proceso del pool: temas, prohibidas y firma MinHash de cada (idioma, título, entradilla, cuerpo)."""
+    detector = DetectorDuplicados()
+    return [
+        analizar_texto(idioma, titulo, descripcion, cuerpo) + (detector.firma(titulo),)
+        for idioma, titulo, descripcion, cuerpo in textos
+    ]
+
+def _comparar_pares(pares: List[Tuple[str, str]]) -> List[bool]:
+    return [es_similar(a, b) for a, b in pares]
+
+def _contexto_procesos():
+    # Sin fork: el pipeline ya tiene hilos en marcha y un fork copiaría sus locks ocupados
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+def _pool_cpu(procesos: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=procesos, mp_context=_contexto_procesos(),
+        initializer=_iniciar_worker_cpu, initargs=tuple(_CONFIG_ACTIVA),
+    )
+
+def _etapa_cpu_procesos(
+    pool: ProcessPoolExecutor,
+    entrada: "queue.Queue[Any]",
+    salida: "queue.Queue[Any]",
+    procesos: int,
+) -> None:
+    """Equivalente a la etapa de keywords, por lotes de hasta PIPELINE_LOTE_CPU artículos
+    repartidos entre los procesos; añade la firma MinHash de cada titular. Un lote sale en
+    cuanto la cola se vacía, así que con poco volumen no se espera a llenarlo."""
+    ventana: "deque[Tuple[List[_Item], Future]]" = deque()
+
+    def emitir_primero() -> None:
+        items, futuro = ventana.popleft()
+        try:
+            resultados = futuro.result()
+        except Exception as e:
+            print(f"⚠️ Error en filtro_keywords ({len(items)} artículos): {e!r}")
+            for item in items:
+                item.motivo = "error"
+        else:
+            for item, (temas, prohibida, firma) in zip(items, resultados):
+                item.temas, item.prohibida, item.firma = temas, prohibida, firma
+        for item in items:
+            salida.put(item)
+
+    def enviar(lote: List[_Item]) -> None:
+        textos = [(it.idioma, it.titulo, it.descripcion, it.cuerpo) for it in lote]
+        for item in lote:
+            item.cuerpo = ""
+        METRICAS.sumar("cpu_lotes")
+        ventana.append((lote, pool.submit(_analizar_lote, textos)))
+        while len(ventana) > procesos * 2:
+            emitir_primero()
+
+    lote: List[_Item] = []
+    while True:
+        try:
+            item = entrada.get(timeout=0.05)
+        except queue.Empty:
+            if lote:
+                enviar(lote)
+                lote = []
+            while ventana and ventana[0][1].done():
+                emitir_primero()
+            continue
+        if item is _FIN:
+            break
+        if item.motivo:
+            salida.put(item)
+            continue
+        lote.append(item)
+        if len(lote) >= PIPELINE_LOTE_CPU:
+            enviar(lote)
+            lote = []
+    if lote:
+        enviar(lote)
+    while ventana:
+        emitir_primero()
+    salida.put(_FIN)
+
+def _comparaciones_lote(items: List[_Item], indice: "IndiceArticulos", pool: ProcessPoolExecutor, procesos: int):
+    """Calcula en paralelo todas las comparaciones de titulares que la deduplicación de
+    `items` (en orden) podría necesitar y devuelve un `similar(a, b)` que las consulta.
+    Un par que faltase se calcula en el momento: el resultado no depende del reparto."""
+    # Solo llegan a la deduplicación los que el índice aún no conoce (ni por URL repetida en
+    # la tanda: la primera aparición decide), y solo se agregan al detector los que tienen temas
+    candidatos = []
+    urls = set()
+    for it in items:
+        if it.motivo or it.prohibida or it.firma is None or it.url in urls:
+            continue
+        urls.add(it.url)
+        if indice.rechazo(it.url) or indice.buscar(it.url, it.titulo) or indice.buscar(it.final_url, it.titulo):
+            continue
+        candidatos.append((it.titulo, it.firma, bool(it.temas)))
+    calculadas: Dict[Tuple[str, str], bool] = {}
+    pares = list(indice.detector.pares_candidatos(candidatos)) if candidatos else []
+    if pares:
+        trozo = max(64, -(-len(pares) // (procesos * 4)))
+        trozos = [pares[i:i + trozo] for i in range(0, len(pares), trozo)]
+        for parte, resultados in zip(trozos, pool.map(_comparar_pares, trozos)):
+            calculadas.update(zip(parte, resultados))
+        METRICAS.sumar("cpu_comparaciones", len(pares))
+
+    def similar(a: str, b: str) -> bool:
+        r = calculadas.get((a, b))
+        return es_similar(a, b) if r is None else r
+
+    return similar
+
+def _recolectar(item: _Item, indice: "IndiceArticulos", selector: SelectorTopK, similar=None) -> None:
+    """Etapa final (un solo hilo, en orden de `seq`): deduplicación, etiquetas y resultado."""
+    titulo, url, tipo, entidades = item.titulo, item.url, item.tipo, item.entidades
+
+    def etiquetar(noticia: Noticia) -> None:
+        for e in entidades:
+            indice.etiquetar(noticia, tipo, e)
+        METRICAS.sumar("ya_vistas")
+        debug_log(f"    🔁 YA VISTA '{titulo[:80]}' (+{', '.join(entidades)})")
+
+    if item.motivo in ("vacía", "error"):
+        return
+    if item.motivo in ("ya enviada", "anterior"):
+        METRICAS.sumar(f"rechazadas.{item.motivo}")
+        debug_log(f"    ⏭️ RECHAZADA ({item.motivo}) '{titulo[:80]}'")
+        return
+    # El índice solo crece: lo que la etapa de medio vio como ya visto o rechazado se vuelve
+    # a encontrar aquí, y lo que entró mientras el item estaba en vuelo también
+    existente = indice.buscar(url, titulo)
+    if existente is not None:
+        etiquetar(existente)
+        return
+    if indice.rechazo(url):
+        METRICAS.sumar("rechazo_repetido")
+        return
+    if item.motivo == "medio":
+        METRICAS.sumar("rechazadas.medio")
+        indice.rechazar(url, "medio")
+        debug_log(f"    ⛔ RECHAZADA (medio) dom={item.dom} publisher='{item.publisher}' url={item.final_url[:120]}")
+        return
+    debug_log(f"    ✅ OK (medio) dom={item.dom} publisher='{item.publisher}'")
+
+    existente = indice.buscar(item.final_url, titulo)
+    if existente is not None:
+        etiquetar(existente)
+        return
+
+    if item.prohibida:
+        METRICAS.sumar("rechazadas.prohibidas")
+        indice.rechazar(url, "prohibidas")
+        debug_log(f"    ⛔ RECHAZADA (prohibidas) '{titulo[:80]}'")
+        return
+
+    with METRICAS.cronometro("dedup"):
+        parecida = indice.buscar_similar(titulo, item.firma, similar)
+    if parecida is not None:
+        for e in entidades:
+            indice.etiquetar(parecida, tipo, e)
+        METRICAS.sumar("rechazadas.duplicada")
+        debug_log(f"    ⛔ RECHAZADA (duplicada) '{titulo[:80]}'")
+        return
+
+    if not item.temas:
+        METRICAS.sumar("rechazadas.sin keywords")
+        indice.rechazar(url, "sin keywords")
+        debug_log(f"    ⛔ RECHAZADA (sin keywords) '{titulo[:80]}'")
+        return
+
+    dom, publisher = item.dom, item.publisher
+    noticia = Noticia(
+        tipo,
+        entidades[0],
+        temas_a_bits(item.temas),
+        titulo,
+        item.final_url,
+        url_original=url,
+        fecha=item.publicado,
+        fuente=publisher or dom or "Google News",
+        dominio=dom,
+        etiquetas=[(tipo, e) for e in entidades],
+        puntuacion=puntuar(item.temas, dom, publisher, parse_fecha(item.publicado)),
+    )
+    indice.registrar(noticia, url, item.firma)
+    METRICAS.sumar("aceptadas")
+    selector.agregar(noticia)
+
+def ejecutar_pipeline(
+    grupos: List[Tuple[List[str], str]],
+    indice: Optional["IndiceArticulos"] = None,
+    vistas: Optional[SeenStore] = None,
+    productor=None,
+    selector: Optional[SelectorTopK] = None,
+) -> Dict[str, List[Noticia]]:
+    """Pipeline en streaming fetch → resolver URL → filtro de medio → [texto] → keywords → dedup → recolector.
+
+    Las etapas se comunican por colas acotadas (PIPELINE_QUEUE), así que una etapa lenta
+    frena a las anteriores en vez de acumular artículos en memoria. Resolver URLs (red) y
+    analizar keywords (CPU) corren en sus propios hilos y se solapan con las descargas.
+    El recolector reordena por número de secuencia: el resultado es el mismo que en serie.
+    Como mucho PIPELINE_VENTANA artículos están en vuelo a la vez: si uno se atasca, la
+    descarga se detiene en vez de acumular en el buffer de reordenación los que le siguen.
+    Con `vistas`, lo enviado en ejecuciones anteriores (o publicado antes de su marca de
+    agua) se descarta antes de resolver la URL. Con ENRICH_TEXTO, el texto de los artículos de
+    medios permitidos se descarga en su propia etapa y se suma a título y entradilla en el
+    análisis de keywords, durante como mucho ENRICH_PRESUPUESTO_S. Devuelve por tipo las noticias nuevas
+    mejor puntuadas (TOPK_POR_ENTIDAD / TOPK_POR_SECCION), de mayor a menor relevancia.
+    `productor(cola, en_vuelo)` sustituye a la descarga de las últimas 24 h (p. ej. el backfill).
+    """
+    cargar_config()
+    if indice is None:
+        indice = IndiceArticulos()
+    corte = None
+    if vistas is not None:
+        watermark = vistas.watermark()
+        if watermark is not None:
+            corte = watermark - SEEN_WATERMARK_MARGIN_H * 3600
+
+    cola_fetch: "queue.Queue[Any]" = queue.Queue(maxsize=PIPELINE_QUEUE)
+    cola_medio: "queue.Queue[Any]" = queue.Queue(maxsize=PIPELINE_QUEUE)
+    cola_filtro: "queue.Queue[Any]" = queue.Queue(maxsize=PIPELINE_QUEUE)
+    procesos = max(0, PIPELINE_PROCESOS)
+    pool = _pool_cpu(procesos) if procesos else None
+
+    en_vuelo = threading.BoundedSemaphore(max(1, PIPELINE_VENTANA))
+    if productor is None:
+        productor = lambda cola, en_vuelo: _productor(grupos, cola, en_vuelo)
+    threading.Thread(target=productor, args=(cola_fetch, en_vuelo), name="fetch", daemon=True).start()
+    _lanzar_etapa("filtro_medio", lambda it: _etapa_medio(it, indice, vistas, corte), cola_fetch, cola_medio, PIPELINE_RESOLVE_WORKERS)
+    if ENRICH_TEXTO:
+        cola_texto: "queue.Queue[Any]" = queue.Queue(maxsize=PIPELINE_QUEUE)
+        limite_texto = time.monotonic() + ENRICH_PRESUPUESTO_S
+        _lanzar_etapa("texto", lambda it: _etapa_texto(it, indice, limite_texto), cola_medio, cola_texto, ENRICH_WORKERS)
+        cola_medio = cola_texto
+    if pool is None:
+        _lanzar_etapa("filtro_keywords", _etapa_keywords, cola_medio, cola_filtro, PIPELINE_FILTER_WORKERS)
+    else:
+        threading.Thread(
+            target=_etapa_cpu_procesos, args=(pool, cola_medio, cola_filtro, procesos), name="filtro_keywords", daemon=True
+        ).start()
+
+    if selector is None:
+        selector = SelectorTopK(TOPK_POR_ENTIDAD, TOPK_POR_SECCION)
+    # Los items llegan desordenados (varios hilos por etapa). El productor ocupa un hueco de
+    # `en_vuelo` por cada número de secuencia y aquí se libera al sacarlo en orden, así que el
+    # buffer nunca pasa de PIPELINE_VENTANA items aunque uno se quede atascado. En modo
+    # multiproceso se reducen por tandas consecutivas, con las comparaciones de titulares
+    # de toda la tanda calculadas antes en paralelo.
+    buffer: Dict[int, _Item] = {}
+    siguiente = 0
+    tanda: List[_Item] = []
+    try:
+        while True:
+            item = cola_filtro.get()
+            if item is not _FIN:
+                buffer[item.seq] = item
+                while siguiente in buffer:
+                    tanda.append(buffer.pop(siguiente))
+                    en_vuelo.release()
+                    siguiente += 1
+            if tanda and (pool is None or item is _FIN or len(tanda) >= PIPELINE_LOTE_CPU or cola_filtro.empty()):
+                similar = None
+                if pool is not None:
+                    with METRICAS.cronometro("dedup_paralelo"):
+                        similar = _comparaciones_lote(tanda, indice, pool, procesos)
+                for pendiente in tanda:
+                    _recolectar(pendiente, indice, selector, similar)
+                tanda = []
+            if item is _FIN:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {tipo: selector.resultado(tipo) for _, tipo in grupos}
+
+def buscar_y_filtrar_entidades(
+    entidades: List[str],
+    tipo: str,
+    indice: Optional["IndiceArticulos"] = None,
+) -> List[Noticia]:
+    """Atajo para una sola sección sobre `ejecutar_pipeline`."""
+    return ejecutar_pipeline([(entidades, tipo)], indice)[tipo]
+
+# (tipo, título de la sección, plural para el mensaje de vacío, color del borde)
+SECCIONES_CORREO = (
+    ("cliente", "🧩 Noticias de Clientes", "clientes", "#2980b9"),
+    ("competidor", "🥊 Noticias de Competidores", "competidores", "#8e44ad"),
+    ("partner", "🤝 Noticias de Partners", "partners", "#16a085"),
+)
+
+def _secciones_presentes(secciones: Dict[str, List[Noticia]]) -> List[Tuple[str, str, str, str]]:
+    """Secciones del correo incluidas en `secciones`, en el orden fijo del informe."""
+    return [s for s in SECCIONES_CORREO if s[0] in secciones]
+
+def _resumen_totales(secciones: Dict[str, List[Noticia]], separador: str = " | ") -> str:
+    return separador.join(f"{plural.capitalize()} {len(secciones[tipo])}" for tipo, _, plural, _ in _secciones_presentes(secciones))
+
+_HTML_CABECERA = """
+    <html>
+    <body style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px;">
+        <div style="max-width: 680px; margin: 0 auto; background-color: #ffffff; padding: 20px; border-radius: 8px;">
+            <h2 style="color: #2c3e50;">📊 Reporte Diario Noticias Accenture</h2>
+            <p>
+                Se han detectado <strong>{total}</strong> noticias relevantes hoy
+                ({resumen}).
+            </p>
+    """.format
+
+_HTML_SECCION = """
+        <hr style="margin-top: 25px;">
+        <h2 style="color:#2c3e50; margin-top: 10px;">{titulo}</h2>
+        <p style="color:#666; font-size:12px;">Total: <strong>{total}</strong></p>
+        <hr>
+    """.format
+
+_HTML_VACIA = "<p style='color:#888;'>No se han encontrado noticias de {plural} con los filtros actuales.</p>".format
+
+_HTML_ENTIDAD = "<h3 style='background-color: #eee; color: #333; padding: 8px; margin-top: 20px;'>{entidad}</h3>".format
+
+_HTML_NOTICIA = """
+            <div style="margin-bottom: 15px; border-left: 3px solid {color}; padding-left: 10px;">
+                <div style="font-size: 10px; color: #e67e22; font-weight: bold;">{temas}</div>
+                <a href="{url}" style="font-size: 14px; font-weight: bold; color: #333; text-decoration: none;">{titulo}</a>
+                <div style="font-size: 11px; color: #888;">{fuente} - {fecha}</div>
+                {otras}
+            </div>
+            """.format
+
+_HTML_PIE = "</div></body></html>"
+
+def _otras_etiquetas(n: Noticia) -> str:
+    return ", ".join(f"{entidad} ({tipo})" for tipo, entidad in n.etiquetas if (tipo, entidad) != (n.tipo, n.entidad))
+
+def _por_entidad(noticias: List[Noticia]) -> Iterable[Tuple[str, List[Noticia]]]:
+    """Agrupa por entidad en orden alfabético; dentro de cada entidad se respeta el orden
+    de entrada (relevancia). No modifica la lista recibida."""
+    grupos: Dict[str, List[Noticia]] = {}
+    for n in noticias:
+        grupos.setdefault(n.entidad, []).append(n)
+    return sorted(grupos.items())
+
+def _renderizar_html(secciones: Dict[str, List[Noticia]]) -> Iterable[str]:
+    """Genera el HTML del correo por fragmentos con una única plantilla de sección y de noticia."""
+    resumen = " | ".join(
+        f"<strong>{plural.capitalize()}:</strong> {len(secciones[tipo])}"
+        for tipo, _, plural, _ in _secciones_presentes(secciones)
+    )
+    yield _HTML_CABECERA(total=sum(len(v) for v in secciones.values()), resumen=resumen)
+
+    for tipo, titulo, plural, color in _secciones_presentes(secciones):
+        noticias = secciones[tipo]
+        yield _HTML_SECCION(titulo=titulo, total=len(noticias))
+        if not noticias:
+            yield _HTML_VACIA(plural=plural)
+            continue
+        for entidad, grupo in _por_entidad(noticias):
+            yield _HTML_ENTIDAD(entidad=escape(entidad))
+            for n in grupo:
+                otras = _otras_etiquetas(n)
+                yield _HTML_NOTICIA(
+                    color=color,
+                    temas=escape(n.temas_texto),
+                    url=escape(n.url),
+                    titulo=escape(n.titulo),
+                    fuente=escape(n.fuente),
+                    fecha=escape(n.fecha),
+                    otras=f'<div style="font-size: 11px; color: #555;">También: {escape(otras)}</div>' if otras else "",
+                )
+
+    yield _HTML_PIE
+
+def _renderizar_texto(secciones: Dict[str, List[Noticia]]) -> Iterable[str]:
+    """Versión en texto plano del mismo informe (parte alternativa del correo)."""
+    yield "Reporte Diario Noticias Accenture\n"
+    yield f"{sum(len(v) for v in secciones.values())} noticias relevantes hoy ({_resumen_totales(secciones)})\n"
+
+    for tipo, titulo, plural, _ in _secciones_presentes(secciones):
+        noticias = secciones[tipo]
+        yield f"\n{'=' * 60}\n{titulo} ({len(noticias)})\n{'=' * 60}\n"
+        if not noticias:
+            yield f"No se han encontrado noticias de {plural} con los filtros actuales.\n"
+            continue
+        for entidad, grupo in _por_entidad(noticias):
+            yield f"\n## {entidad}\n"
+            for n in grupo:
+                yield f"\n- {n.titulo}\n  {n.url}\n  {n.fuente} - {n.fecha}"
+                if n.temas:
+                    yield f" [{n.temas_texto}]"
+                otras = _otras_etiquetas(n)
+                if otras:
+                    yield f"\n  También: {otras}"
+                yield "\n"
+
+def construir_html(
+    noticias_clientes: List[Noticia],
+    noticias_competidores: List[Noticia],
+    noticias_partners: List[Noticia],
+) -> str:
+    secciones = {"cliente": noticias_clientes, "competidor": noticias_competidores, "partner": noticias_partners}
+    return "".join(_renderizar_html(secciones))
+
+def construir_texto(
+    noticias_clientes: List[Noticia],
+    noticias_competidores: List[Noticia],
+    noticias_partners: List[Noticia],
+) -> str:
+    secciones = {"cliente": noticias_clientes, "competidor": noticias_competidores, "partner": noticias_partners}
+    return "".join(_renderizar_texto(secciones))
+
+def segmentos_destinatarios(
+    raw_todos: str, raw_por_tipo: Dict[str, str]
+) -> List[Tuple[Tuple[str, ...], List[str]]]:
+    """Agrupa destinatarios por las secciones que reciben: [(tipos, destinatarios), ...].
+
+    Quien está en EMAIL_TO recibe el informe completo; el resto, solo las secciones de las
+    EMAIL_TO_<TIPO> en las que aparece. Cada grupo se renderiza una vez y se envía en un único
+    mensaje a todos sus destinatarios.
+    """
+    todos = tuple(tipo for tipo, _, _, _ in SECCIONES_CORREO)
+    por_destinatario: Dict[str, List[str]] = {}
+    for e in parse_recipients(raw_todos):
+        por_destinatario[e] = list(todos)
+    for tipo in todos:
+        for e in parse_recipients(raw_por_tipo.get(tipo, "")):
+            tipos = por_destinatario.setdefault(e, [])
+            if tipo not in tipos:
+                tipos.append(tipo)
+
+    grupos: Dict[Tuple[str, ...], List[str]] = {}
+    for e, tipos in por_destinatario.items():
+        grupos.setdefault(tuple(t for t in todos if t in tipos), []).append(e)
+    return sorted(grupos.items(), key=lambda g: (-len(g[0]), [todos.index(t) for t in g[0]]))
+
+def construir_mensaje(secciones: Dict[str, List[Noticia]], recipients: List[str]) -> MIMEMultipart:
+    """Correo multipart/alternative (texto plano + HTML) con las secciones dadas."""
+    with METRICAS.cronometro("render"):
+        html = "".join(_renderizar_html(secciones))
+        texto = "".join(_renderizar_texto(secciones))
+
+    # multipart/alternative: texto plano primero, HTML al final (el preferido por el cliente)
+    msg = MIMEMultipart("alternative")
+    msg["From"] = EMAIL_USER
+    # ✅ MUST CHANGE #2: cabecera To correcta
+    msg["To"] = ", ".join(recipients)
+
+    total = sum(len(v) for v in secciones.values())
+    msg["Subject"] = f"🚀 Reporte Diario: {total} noticias ({_resumen_totales(secciones)})"
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = make_msgid(domain=None)
+
+    msg.attach(MIMEText(texto, "plain", "utf-8"))
+    msg.attach(MIMEText(html, "html", "utf-8"))
+    return msg
+
+class EntregaSMTP:
+    """Sesión SMTP reutilizable: conecta (STARTTLS + login) una vez y envía muchos mensajes.
+
+    Ante errores transitorios (respuestas 4xx, desconexión, timeout) reconecta y reintenta
+    hasta `reintentos` veces con backoff exponencial; los permanentes (5xx) se propagan.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        timeout: float,
+        starttls: bool,
+        usuario: str = "",
+        password: str = "",
+        reintentos: int = SMTP_RETRIES,
+        backoff: float = SMTP_BACKOFF_S,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.starttls = starttls
+        self.usuario = usuario
+        self.password = password
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.enviados = 0
+        self.conexiones = 0
+        self._server: Optional[smtplib.SMTP] = None
+
+    @staticmethod
+    def es_transitorio(e: Exception) -> bool:
+        if isinstance(e, smtplib.SMTPRecipientsRefused):
+            return all(400 <= codigo < 500 for codigo, _ in e.recipients.values())
+        if isinstance(e, smtplib.SMTPResponseException):
+            return 400 <= e.smtp_code < 500
+        if isinstance(e, smtplib.SMTPException):
+            # SMTPException hereda de OSError: solo la desconexión es transitoria
+            return isinstance(e, smtplib.SMTPServerDisconnected)
+        return isinstance(e, OSError)
+
+    def _conectar(self) -> smtplib.SMTP:
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                server.ehlo()
+                if self.starttls:
+                    server.starttls()
+                    server.ehlo()
+                if self.usuario and self.password:
+                    server.login(self.usuario, self.password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+            self.conexiones += 1
+        return self._server
+
+    def _descartar(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.close()
+            finally:
+                self._server = None
+
+    def enviar(self, msg: MIMEMultipart, recipients: List[str]) -> Dict[str, Tuple[int, bytes]]:
+        """Envía `msg`; devuelve los destinatarios rechazados (si los acepta todos, {})."""
+        datos = msg.as_string()
+        intento = 0
+        while True:
+            try:
+                with METRICAS.cronometro("smtp"):
+                    rechazados = self._conectar().sendmail(self.usuario or msg["From"], recipients, datos)
+                self.enviados += 1
+                METRICAS.sumar("correos_enviados")
+                return rechazados
+            except Exception as e:
+                self._descartar()
+                if intento >= self.reintentos or not self.es_transitorio(e):
+                    raise
+                espera = self.backoff * (2 ** intento) * (0.5 + random.random())
+                intento += 1
+                METRICAS.sumar("smtp_reintentos")
+                print(f"⚠️ SMTP transitorio ({e}); reintento {intento}/{self.reintentos} en {espera:.1f}s")
+                time.sleep(espera)
+
+    def close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except OSError:
+                pass
+            self._descartar()
+
+    def __enter__(self) -> "EntregaSMTP":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+def entrega_smtp() -> EntregaSMTP:
+    return EntregaSMTP(
+        SMTP_HOST, SMTP_PORT, SMTP_TIMEOUT, SMTP_STARTTLS,
+        EMAIL_USER, EMAIL_PASS if SMTP_AUTH else "",
+    )
+
+def enviar_informes(
+    noticias: Dict[str, List[Noticia]],
+    segmentos: List[Tuple[Tuple[str, ...], List[str]]],
+    entrega: Optional[EntregaSMTP] = None,
+) -> bool:
+    """Renderiza una vez cada segmento y lo envía por una única sesión SMTP.
+
+    Devuelve True solo si todos los segmentos se entregaron.
+    """
+    if not any(noticias.values()):
+        print("\n📭 Informe vacío (se enviará correo igualmente).")
+
+    propia = entrega is None
+    entrega = entrega or entrega_smtp()
+    ok = True
+    try:
+        for tipos, recipients in segmentos:
+            msg = construir_mensaje({t: noticias.get(t, []) for t in tipos}, recipients)
+            try:
+                rechazados = entrega.enviar(msg, recipients)
+            except Exception as e:
+                print(f"❌ Error enviando correo ({', '.join(tipos)}): {e}")
+                ok = False
+                continue
+            aceptados = [r for r in recipients if r not in rechazados]
+            print(f"✅ Correo ({', '.join(tipos)}) enviado a {len(aceptados)} destinatario(s): {', '.join(aceptados)}")
+            if rechazados:
+                print(f"⚠️ Rechazados por el servidor: {', '.join(rechazados)}")
+    finally:
+        if propia:
+            entrega.close()
+    return ok
+
+def enviar_correo(
+    noticias_clientes: List[Noticia],
+    noticias_competidores: List[Noticia],
+    noticias_partners: List[Noticia],
+    recipients: List[str]
+) -> bool:
+    """Informe completo a `recipients` (atajo sobre `enviar_informes`)."""
+    noticias = {"cliente": noticias_clientes, "competidor": noticias_competidores, "partner": noticias_partners}
+    return enviar_informes(noticias, [(tuple(noticias), recipients)])
+
+def _ruta_checkpoint(entidad: str, dia: date) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", plegar(entidad)).strip("-")[:40]
+    huella = hashlib.sha1(entidad.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(BACKFILL_DIR, dia.isoformat(), f"{slug}-{huella}.json.gz")
+
+def _leer_checkpoint(path: str) -> Optional[List[Dict[str, Any]]]:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # inexistente o a medio escribir: se vuelve a descargar
+
+def _iniciar_worker_backfill(rps: float) -> None:
+    # Cada proceso tiene su propio limitador: entre todos suman FETCH_RPS
+    global NOTICIAS_MODO
+    _CONTROL.rps_max = _CONTROL.rps = max(rps, 0.01)
+    _CONTROL.rps_min = min(_CONTROL.rps_min, _CONTROL.rps_max)
+    _RATE_LIMITER.ajustar(_CONTROL.rps)
+    if NOTICIAS_MODO == "record":
+        NOTICIAS_MODO = ""  # varios procesos no pueden grabar en el mismo corpus
+
+def _descargar_shard(entidad: str, dia: date, path: str) -> List[Dict[str, Any]]:
+    """Descarga (en un proceso del pool) las noticias de una entidad en un día y las guarda."""
+    resultados = descargar_noticias(entidad, hasta=time.monotonic() + GNEWS_REINTENTO_MAX_ESPERA_S, dia=dia)
+    carpeta = os.path.dirname(path)
+    os.makedirs(carpeta, exist_ok=True)
+    temporal = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(temporal, "wt", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False)
+    os.replace(temporal, path)  # atómico: un checkpoint existe entero o no existe
+    return resultados
+
+def shards_backfill(
+    grupos: List[Tuple[List[str], str]], desde: date, hasta: date
+) -> List[Tuple[str, str, date]]:
+    """Shards (tipo, entidad, día) del rango [desde, hasta], en orden estable."""
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    return [(tipo, entidad, dia) for dia in dias for entidades, tipo in grupos for entidad in entidades]
+
+def _productor_backfill(
+    shards: List[Tuple[str, str, date]],
+    salida: "queue.Queue[Any]",
+    workers: int,
+    rehacer: bool,
+    en_vuelo: Optional[threading.BoundedSemaphore] = None,
+) -> None:
+    """Etapa fetch del backfill: reparte los shards entre procesos y emite en el orden de `shards`.
+
+    Los shards con checkpoint en disco no se vuelven a descargar; los que fallan no dejan
+    checkpoint y se descargan al relanzar el mismo backfill.
+    """
+    workers = max(1, workers)
+    seq = 0
+    hechos = fallidos = 0
+    try:
+        # El pool se crea desde el hilo fetch, con las demás etapas ya en marcha: nada de fork
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=_contexto_procesos(),
+            initializer=_iniciar_worker_backfill, initargs=(FETCH_RPS / workers,),
+        ) as pool:
+            pendientes = iter(enumerate(shards, 1))
+            ventana: "deque[Tuple[int, str, str, date, Any]]" = deque()
+
+            def lanzar() -> None:
+                siguiente = next(pendientes, None)
+                if siguiente is None:
+                    return
+                i, (tipo, entidad, dia) = siguiente
+                path = _ruta_checkpoint(entidad, dia)
+                previos = None if rehacer else _leer_checkpoint(path)
+                trabajo = previos if previos is not None else pool.submit(_descargar_shard, entidad, dia, path)
+                ventana.append((i, tipo, entidad, dia, trabajo))
+
+            for _ in range(workers * 2):
+                lanzar()
+
+            while ventana:
+                i, tipo, entidad, dia, trabajo = ventana.popleft()
+                lanzar()
+                origen = "💾"
+                if isinstance(trabajo, Future):
+                    try:
+                        trabajo = trabajo.result()
+                        origen = "🔹"
+                    except Exception as e:
+                        fallidos += 1
+                        METRICAS.sumar("backfill_fallidos")
+                        print(f"⚠️ [{i}/{len(shards)}] {dia} {entidad} ({tipo}): {e}")
+                        continue
+                hechos += 1
+                print(f"[{i}/{len(shards)}] {origen} {dia} {entidad} ({tipo})... {len(trabajo)} analizadas.")
+                seq = _emitir_articulos([entidad], tipo, [entidad], trabajo, salida, seq, en_vuelo=en_vuelo)
+    finally:
+        print(f"📅 Backfill: {hechos} shard(s) completos, {fallidos} fallido(s) (relanza para reintentarlos).")
+        salida.put(_FIN)
+
+def backfill_cli(argv: List[str]) -> int:
+    """python main.py backfill --desde AAAA-MM-DD --hasta AAAA-MM-DD [opciones]"""
+    parser = argparse.ArgumentParser(prog="main.py backfill", description="Reconstruye la cobertura de un rango de días.")
+    parser.add_argument("--desde", required=True, type=date.fromisoformat, help="primer día (AAAA-MM-DD)")
+    parser.add_argument("--hasta", required=True, type=date.fromisoformat, help="último día, incluido (AAAA-MM-DD)")
+    parser.add_argument("--tipos", default="cliente,competidor,partner", help="secciones a reconstruir")
+    parser.add_argument("--entidades", default="", help="solo estas entidades (separadas por comas)")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="procesos de descarga")
+    parser.add_argument("--rehacer", action="store_true", help="ignorar los checkpoints y descargar todo")
+    parser.add_argument("--salida", default="", help="JSON con las noticias aceptadas (por defecto backfill_<desde>_<hasta>.json)")
+    parser.add_argument("--enviar", action="store_true", help="enviar además el informe por correo")
+    args = parser.parse_args(argv)
+    if args.hasta < args.desde:
+        parser.error("--hasta es anterior a --desde")
+
+    cargar_config()
+    listas = {"cliente": CLIENTES, "competidor": COMPETIDORES, "partner": PARTNERS}
+    tipos = [t.strip() for t in args.tipos.split(",") if t.strip()]
+    desconocidos = [t for t in tipos if t not in listas]
+    if desconocidos:
+        parser.error(f"tipos desconocidos: {', '.join(desconocidos)}")
+    solo = {e.strip() for e in args.entidades.split(",") if e.strip()}
+    grupos = [([e for e in listas[t] if not solo or e in solo], t) for t in tipos]
+
+    shards = shards_backfill(grupos, args.desde, args.hasta)
+    print(f"📅 BACKFILL {args.desde} → {args.hasta}: {len(shards)} shard(s) entidad × día, {args.workers} proceso(s)")
+
+    # Sin top-K ni marca de agua: se quiere todo lo del rango, deduplicado y filtrado igual que a diario
+    indice = IndiceArticulos()
+    noticias = ejecutar_pipeline(
+        grupos,
+        indice,
+        productor=lambda cola, en_vuelo: _productor_backfill(shards, cola, args.workers, args.rehacer, en_vuelo),
+        selector=SelectorTopK(0, 0),
+    )
+    salida = args.salida or f"backfill_{args.desde}_{args.hasta}.json"
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump({tipo: [n.a_dict() for n in lista] for tipo, lista in noticias.items()}, f, ensure_ascii=False, indent=2)
+    print(f"💾 {sum(len(v) for v in noticias.values())} noticias guardadas en {salida}")
+    historico().guardar(indice.aceptadas(), contadores_rechazo(), modo="backfill")
+
+    ok = True
+    if args.enviar:
+        segmentos = segmentos_destinatarios(EMAIL_TO_RAW, {
+            tipo: os.environ.get(f"EMAIL_TO_{tipo.upper()}", "").strip() for tipo, _, _, _ in SECCIONES_CORREO
+        })
+        validate_env([r for _, destinatarios in segmentos for r in destinatarios])
+        ok = enviar_informes({t: noticias.get(t, []) for t in tipos}, segmentos)
+
+    historico().close()
+    corpus_activo().close()
+    redirect_cache().close()
+    texto_cache().close()
+    METRICAS.exportar(METRICS_JSON, METRICS_PROM)
+    return 0 if ok else 1
+
+def historico_cli(argv: List[str]) -> int:
+    """python main.py historico {menciones,temas,rechazos} [--desde] [--hasta] [--tipo] [--top]"""
+    parser = argparse.ArgumentParser(prog="main.py historico", description="Consultas de tendencias sobre el histórico.")
+    parser.add_argument("consulta", choices=["menciones", "temas", "rechazos"])
+    parser.add_argument("--desde", type=date.fromisoformat, default=None, help="primer día (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, default=None, help="último día, incluido (AAAA-MM-DD)")
+    parser.add_argument("--tipo", default="", help="cliente, competidor o partner")
+    parser.add_argument("--entidades", default="", help="solo estas entidades (separadas por comas)")
+    parser.add_argument("--top", type=int, default=5, help="temas por entidad")
+    args = parser.parse_args(argv)
+
+    store = historico()
+    if args.consulta == "menciones":
+        entidades = [e.strip() for e in args.entidades.split(",") if e.strip()]
+        df = store.menciones_por_semana(args.desde, args.hasta, args.tipo or None, entidades or None)
+    elif args.consulta == "temas":
+        df = store.top_temas(args.tipo or "competidor", args.desde, args.hasta, args.top)
+    else:
+        df = store.rechazos_por_dia(args.desde, args.hasta)
+    print(df.to_string() if not df.empty else "Sin datos en el histórico para ese rango.")
+    store.close()
+    return 0
+
+def config_cli(argv: List[str]) -> int:
+    """python main.py config [--salida config.json]: vuelca la configuración efectiva."""
+    parser = argparse.ArgumentParser(prog="main.py config", description="Muestra la configuración efectiva (código + CONFIG_PATH) en JSON.")
+    parser.add_argument("--salida", default="", help="escribir en este fichero en vez de en pantalla")
+    args = parser.parse_args(argv)
+    cargar_config()
+    texto = json.dumps(leer_config(CONFIG_PATH), ensure_ascii=False, indent=2) + "\n"
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+        print(f"💾 Configuración escrita en {args.salida} (huella {_CONFIG_HUELLA[:12]})")
+    else:
+        sys.stdout.write(texto)
+    return 0
+
+def ejecutar_informe(segmentos: List[Tuple[Tuple[str, ...], List[str]]], barrido: bool = False) -> bool:
+    """Una ejecución completa: pipeline, envío, vistas e histórico. No cierra nada compartido.
+
+    En un barrido (`barrido=True`) no se envía correo si no hay noticias nuevas.
+    """
+    cargar_config()
+    inicio_ejecucion = time.time()
+    vistas = seen_store()
+
+    # Un único pipeline para las tres listas: mismo pool de descarga, mismo rate limiter
+    # y un único índice, así cada noticia aparece una vez en el correo con todas sus etiquetas
+    indice = IndiceArticulos()
+    noticias = ejecutar_pipeline([
+        (CLIENTES, "cliente"),
+        (COMPETIDORES, "competidor"),
+        (PARTNERS, "partner"),
+    ], indice, vistas=vistas)
+
+    if barrido and not any(noticias.values()):
+        print("📭 Barrido sin novedades: no se envía correo.")
+        enviado = False
+    else:
+        enviado = enviar_informes(noticias, segmentos)
+    if enviado:
+        # Solo lo entregado cuenta como visto; si el envío falla, mañana se reintenta
+        for lista in noticias.values():
+            for n in lista:
+                vistas.marcar(SeenStore.claves(n.url_original, n.titulo, n.url))
+        vistas.set_watermark(inicio_ejecucion)
+    # Al histórico va todo lo aceptado, no solo el top-K del correo
+    historico().guardar(indice.aceptadas(), contadores_rechazo(), modo="barrido" if barrido else "diario", enviado=enviado)
+
+    print(f"🗃️ Caché de redirecciones: {redirect_cache().stats()}")
+    if ENRICH_TEXTO:
+        print(f"📰 Caché de textos: {texto_cache().stats()}")
+    print(f"🚦 Control de peticiones a Google: {_CONTROL.estado()}")
+    METRICAS.exportar(METRICS_JSON, METRICS_PROM)
+    print("⏱️ Etapas: " + ", ".join(f"{k}={v['segundos']:.1f}s" for k, v in sorted(METRICAS.etapas.items())))
+    return enviado
+
+def mantener_recursos() -> None:
+    """Poda de cachés y del registro de vistas entre ejecuciones del daemon (sin cerrarlos)."""
+    redirect_cache().evict()
+    texto_cache().evict()
+    seen_store().compactar()
+
+def cerrar_recursos() -> None:
+    seen_store().close()
+    historico().close()
+    corpus_activo().close()
+    redirect_cache().close()
+    texto_cache().close()
+
+class Cron:
+    """Expresión cron de 5 campos (minuto hora día-mes mes día-semana), en UTC.
+
+    Admite *, valores, listas (1,15), rangos (8-20) y pasos (*/15, 8-20/2). Como en cron, si
+    día del mes y día de la semana están restringidos basta con que case uno de los dos.
+    """
+
+    def __init__(self, expresion: str) -> None:
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expresión cron inválida (se esperan 5 campos): {expresion!r}")
+        self.expresion = expresion
+        self.minutos = self._campo(campos[0], 0, 59)
+        self.horas = self._campo(campos[1], 0, 23)
+        self.dias = self._campo(campos[2], 1, 31)
+        self.meses = self._campo(campos[3], 1, 12)
+        # 0 y 7 son domingo
+        self.dias_semana = {d % 7 for d in self._campo(campos[4], 0, 7)}
+        self._todos_dias = campos[2] == "*"
+        self._todos_dias_semana = campos[4] == "*"
+
+    @staticmethod
+    def _campo(texto: str, minimo: int, maximo: int) -> frozenset:
+        valores = set()
+        for parte in texto.split(","):
+            rango, barra, paso_txt = parte.partition("/")
+            try:
+                paso = int(paso_txt) if barra else 1
+                if rango == "*":
+                    inicio, fin = minimo, maximo
+                elif "-" in rango:
+                    inicio, fin = (int(x) for x in rango.split("-", 1))
+                else:
+                    inicio = int(rango)
+                    fin = maximo if barra else inicio
+            except ValueError:
+                raise ValueError(f"Campo cron inválido: {texto!r}") from None
+            if paso < 1 or inicio < minimo or fin > maximo or inicio > fin:
+                raise ValueError(f"Campo cron fuera de rango: {texto!r}")
+            valores.update(range(inicio, fin + 1, paso))
+        return frozenset(valores)
+
+    def _dia_ok(self, t: datetime) -> bool:
+        dia = t.day in self.dias
+        dia_semana = (t.weekday() + 1) % 7 in self.dias_semana
+        if self._todos_dias or self._todos_dias_semana:
+            return dia and dia_semana
+        return dia or dia_semana
+
+    def siguiente(self, desde: datetime) -> datetime:
+        """Primer minuto estrictamente posterior a `desde` que casa con la expresión."""
+        t = desde.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = t + timedelta(days=366 * 5)
+        while t < limite:
+            if t.month not in self.meses:
+                t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._dia_ok(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.horas:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutos:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"La expresión cron {self.expresion!r} no casa con ninguna fecha")
+
+def _crons(texto: str) -> List[Cron]:
+    return [Cron(e.strip()) for e in texto.split(";") if e.strip()]
+
+def daemon_cli(argv: List[str]) -> int:
+    """python main.py daemon [--cron "30 7 * * *"] [--barridos "0 8-20 * * 1-5"] [--ahora]"""
+    parser = argparse.ArgumentParser(prog="main.py daemon", description="Proceso residente que ejecuta el informe según un horario cron (UTC).")
+    parser.add_argument("--cron", default=DAEMON_CRON, help="horario del informe diario (varias expresiones separadas por ;)")
+    parser.add_argument("--barridos", default=DAEMON_CRON_BARRIDOS, help="horario de los barridos de última hora")
+    parser.add_argument("--ahora", action="store_true", help="ejecutar un informe nada más arrancar")
+    args = parser.parse_args(argv)
+    try:
+        horario = [(c, False) for c in _crons(args.cron)] + [(c, True) for c in _crons(args.barridos)]
+    except ValueError as e:
+        parser.error(str(e))
+    if not horario:
+        parser.error("no hay ningún horario configurado")
+    cargar_config()
+
+    segmentos = segmentos_destinatarios(EMAIL_TO_RAW, {
+        tipo: os.environ.get(f"EMAIL_TO_{tipo.upper()}", "").strip() for tipo, _, _, _ in SECCIONES_CORREO
+    })
+    validate_env([r for _, destinatarios in segmentos for r in destinatarios])
+
+    parar = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: parar.set())
+
+    print(f"🛰️ DAEMON: informe '{args.cron}'" + (f", barridos '{args.barridos}'" if args.barridos else "") + " (UTC)")
+    pendiente_ahora = args.ahora
+    try:
+        while not parar.is_set():
+            if pendiente_ahora:
+                pendiente_ahora, barrido = False, False
+            else:
+                ahora = datetime.now(timezone.utc)
+                # A la misma hora, el informe diario tiene prioridad sobre el barrido
+                proxima, barrido = min((c.siguiente(ahora), b) for c, b in horario)
+                print(f"⏰ Próximo {'barrido' if barrido else 'informe'}: {proxima:%Y-%m-%d %H:%M} UTC")
+                if parar.wait(max(0.0, (proxima - datetime.now(timezone.utc)).total_seconds())):
+                    break
+            print(f"\n🚀 {'BARRIDO' if barrido else 'INFORME'}: {datetime.now().strftime('%H:%M:%S')}")
+            try:
+                if recargar_config():
+                    print(f"🔄 Configuración recargada de {CONFIG_PATH} ({_CONFIG_HUELLA[:12]})")
+            except Exception as e:
+                print(f"⚠️ Configuración inválida, se mantiene la anterior: {e}")
+            METRICAS.reiniciar()
+            try:
+                ejecutar_informe(segmentos, barrido=barrido)
+            except Exception as e:
+                # Un fallo puntual no tumba el proceso: las cachés siguen calientes para la siguiente
+                METRICAS.sumar("daemon_errores")
+                print(f"❌ Error en la ejecución: {e!r}")
+            # close() ya no llega hasta que se para el daemon: TTL, tamaño y retención se
+            # aplican aquí, tras cada ejecución
+            try:
+                mantener_recursos()
+            except Exception as e:
+                print(f"⚠️ Error en el mantenimiento de cachés: {e!r}")
+    finally:
+        cerrar_recursos()
+        print("👋 Daemon detenido.")
+    return 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        sys.exit(backfill_cli(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "historico":
+        sys.exit(historico_cli(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "config":
+        sys.exit(config_cli(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        sys.exit(daemon_cli(sys.argv[2:]))
+
+    print(f"🚀 AGENTE NUBE (PRO): {datetime.now().strftime('%H:%M:%S')}")
+    segmentos = segmentos_destinatarios(EMAIL_TO_RAW, {
+        tipo: os.environ.get(f"EMAIL_TO_{tipo.upper()}", "").strip() for tipo, _, _, _ in SECCIONES_CORREO
+    })
+    validate_env([r for _, destinatarios in segmentos for r in destinatarios])
+
+    try:
+        ejecutar_informe(segmentos)
+    finally:
+        cerrar_recursos()